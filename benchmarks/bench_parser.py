@@ -0,0 +1,182 @@
+"""
+PackageList 解析器基准测试
+
+    python benchmarks/bench_parser.py                                   # 生成样例、校验结果并输出耗时
+    python benchmarks/bench_parser.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_parser.py --baseline benchmarks/baseline.json --threshold 0.2
+
+分别统计 do（完整解析）、extract_text、get_table、format_table、word_table 和 Excel 写入的耗时，
+以及开启页面并行提取时 1 个和 2 个解析进程整批解析的耗时；每项重复 --repeat 次取最小值。样例的期望字段值同时用于校验两种表格引擎的解析结果。
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import build_corpus, load_corpus  # noqa: E402
+from report import compare, print_results, save_results  # noqa: E402
+
+import fitz  # noqa: E402
+from ptof.logger import log_init  # noqa: E402
+from ptof.pdf_parser import ColumnarResult, create_parser  # noqa: E402
+from ptof.pdf_parser.table import word_table  # noqa: E402
+from ptof import writer  # noqa: E402
+
+
+TABLE_SNIFF = r'^([\S]+\s*)?Item'
+FLAGS = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_SPANS
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float = 0.02) -> Dict[str, float]:
+    """
+    每轮循环执行 func 直到耗时不少于 min_time（毫秒级以下的项目噪声太大），返回单次耗时的最小值和中位数
+    """
+
+    start = time.perf_counter()
+    func()
+    number = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def check_result(name: str, engine: str, result: Optional[ColumnarResult], expected: Dict[str, Any]) -> List[str]:
+    """
+    校验解析结果，返回错误信息列表
+    """
+
+    if not result:
+        return [f'{name} [{engine}]: 解析结果为空']
+    errors = []
+    columns = {'Date': '入库日期', 'PO_No': 'PO No', 'Good_Qty': 'Good Qty', 'Device': 'Device', 'OSAT_Device': 'OSAT Device', 'Lot_No': 'Lot No'}
+    for key, column in columns.items():
+        value = next(result.column(column))
+        if value != expected[key]:
+            errors.append(f'{name} [{engine}]: {column} 为 {value!r}, 期望 {expected[key]!r}')
+    wafer_ids = list(result.column('Wafer ID'))
+    if wafer_ids != expected['Wafer_ID']:
+        errors.append(f'{name} [{engine}]: Wafer ID 为 {wafer_ids}, 期望 {expected["Wafer_ID"]}')
+    return errors
+
+
+def bench_file(pdf_file: str, repeat: int, output_dir: str) -> Dict[str, Dict[str, float]]:
+    import re
+    sniff = re.compile(TABLE_SNIFF)
+    words_parser = create_parser('PackageList')
+    words_parser.table_engine = 'words'
+    text_parser = create_parser('PackageList')
+    text_parser.table_engine = 'text'
+
+    page_words: List = []
+    with fitz.open(pdf_file) as pdf:
+        page_text = words_parser.extract_text(pdf, FLAGS, page_words)
+    table_info, _ = text_parser.get_table(page_text, sniff, line_offset=0)
+    rows = words_parser.do(pdf_file)
+
+    def extract_text():
+        with fitz.open(pdf_file) as pdf:
+            words_parser.extract_text(pdf, FLAGS, [])
+
+    def write_excel():
+        with writer.create_writer('openpyxl', os.path.join(output_dir, 'bench.xlsx')) as excel:
+            excel.write_rows(rows)
+
+    return {
+        'do[words]': measure(lambda: words_parser.do(pdf_file), repeat),
+        'do[text]': measure(lambda: text_parser.do(pdf_file), repeat),
+        'extract_text': measure(extract_text, repeat),
+        'get_table': measure(lambda: text_parser.get_table(page_text, sniff, line_offset=0), repeat),
+        'format_table': measure(lambda: text_parser.format_table(table_info), repeat),
+        'word_table': measure(lambda: word_table(page_words, sniff), repeat),
+        'excel_write': measure(write_excel, repeat),
+    }
+
+
+def bench_page_parallel(corpus_dir: str, names: List[str], repeat: int, output_dir: str) -> Dict[str, Dict[str, float]]:
+    """
+    开启页面并行提取（threshold 5, chunk_pages 5）时整批解析并写入 Excel 的耗时，分别使用 1 个和 2 个解析进程；
+    多个解析进程时每个解析进程各有一个页面提取进程池，解析进程退出时需关闭，否则整批解析不会返回
+    """
+
+    from ptof import tools
+    files = [os.path.join(corpus_dir, name) for name in names]
+    timings = {}
+    for workers in [1, 2]:
+        config = {
+            'attachments': {'file_ext': '.pdf'},
+            'parse_results': {
+                'output': os.path.join(output_dir, f'page_parallel_{workers}'),
+                'workers': workers,
+                'page_parallel': {'threshold': 5, 'chunk_pages': 5},
+            },
+        }
+
+        def extract_to_excel():
+            output_files = tools.extract_pdf_to_excel(config, tools.local_attachments(files))
+            if len(output_files) != len(files):
+                raise RuntimeError(f'页面并行 [workers={workers}]: 输出 {len(output_files)} 个文件, 期望 {len(files)} 个')
+
+        timings[f'extract_to_excel[workers={workers}]'] = measure(extract_to_excel, repeat, min_time=0)
+    return timings
+
+
+@click.command()
+@click.option('--corpus-dir', type=click.Path(), default=None, help='样例目录，默认生成到临时目录；目录中已有 expected.json 时直接使用')
+@click.option('--repeat', type=int, default=5, help='每项重复次数，取最小值')
+@click.option('--output', type=click.Path(), default=None, help='保存本次结果（JSON）')
+@click.option('--save-baseline', type=click.Path(), default=None, help='将本次结果保存为基线')
+@click.option('--baseline', type=click.Path(exists=True), default=None, help='与基线对比')
+@click.option('--threshold', type=float, default=0.2, help='比基线慢超过该比例时视为性能回退')
+def main(corpus_dir, repeat, output, save_baseline, baseline, threshold):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_init({'log': {'level': 'warning', 'output': os.path.join(tmp_dir, 'bench.log'), 'enqueue': False}})
+        corpus_dir = corpus_dir or os.path.join(tmp_dir, 'corpus')
+        if os.path.exists(os.path.join(corpus_dir, 'expected.json')):
+            expected = load_corpus(corpus_dir)
+        else:
+            expected = build_corpus(corpus_dir)
+
+        # 正确性校验：两种表格引擎的解析结果都应与期望一致
+        errors = []
+        for name, values in expected.items():
+            for engine in ['words', 'text']:
+                parser = create_parser('PackageList')
+                parser.table_engine = engine
+                errors.extend(check_result(name, engine, parser.do(os.path.join(corpus_dir, name)), values))
+        for error in errors:
+            click.echo(error, err=True)
+        if errors:
+            sys.exit(2)
+        click.echo('{} 个样例解析结果校验通过'.format(len(expected)))
+
+        results: Dict[str, Any] = {
+            'python': sys.version.split()[0],
+            'pymupdf': fitz.VersionBind,
+            'repeat': repeat,
+            'files': {},
+        }
+        for name in expected.keys():
+            results['files'][name] = bench_file(os.path.join(corpus_dir, name), repeat, tmp_dir)
+        results['files']['page_parallel'] = bench_page_parallel(corpus_dir, list(expected.keys()), repeat, tmp_dir)
+
+    save_results(results, output, save_baseline)
+    if baseline:
+        regressions = compare(results, baseline, threshold)
+        if regressions:
+            sys.exit(1)
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
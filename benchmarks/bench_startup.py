@@ -0,0 +1,87 @@
+"""
+命令行冷启动耗时
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --save-baseline benchmarks/startup_baseline.json
+    python benchmarks/bench_startup.py --baseline benchmarks/startup_baseline.json --threshold 0.2
+
+每个命令在新进程中执行 --repeat 次，统计从启动到退出的耗时；--importtime 输出 --help 导入耗时最多的模块。
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import compare, print_results, save_results  # noqa: E402
+
+
+COMMANDS = {
+    'python -c pass': ['-c', 'pass'],  # 解释器本身的启动耗时，作为参照
+    '--help': ['-m', 'ptof', '--help'],
+    'show-config-file': ['-m', 'ptof', 'show-config-file'],
+    'pipeline --help': ['-m', 'ptof', 'pipeline', '--help'],
+    'parse-attachments --help': ['-m', 'ptof', 'parse-attachments', '--help'],
+}
+
+
+def run_command(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_times(args: List[str], top: int = 15) -> List[tuple]:
+    """
+    python -X importtime 的结果，按累计耗时倒序
+    """
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_time, cumulative, module = [part.strip() for part in line.replace('import time:', '|').split('|')]
+        modules.append((int(cumulative), int(self_time), module))
+    return sorted(modules, reverse=True)[:top]
+
+
+@click.command()
+@click.option('--repeat', type=int, default=10, help='每个命令的执行次数')
+@click.option('--output', type=click.Path(), default=None, help='保存本次结果（JSON）')
+@click.option('--save-baseline', type=click.Path(), default=None, help='将本次结果保存为基线')
+@click.option('--baseline', type=click.Path(exists=True), default=None, help='与基线对比')
+@click.option('--threshold', type=float, default=0.2, help='比基线慢超过该比例时视为性能回退')
+@click.option('--importtime', is_flag=True, default=False, help='输出 --help 导入耗时最多的模块')
+def main(repeat, output, save_baseline, baseline, threshold, importtime):
+    timings: Dict[str, Dict[str, float]] = {}
+    for name, args in COMMANDS.items():
+        run_command(args)  # 预热文件系统缓存和 .pyc
+        samples = [run_command(args) for _ in range(repeat)]
+        timings[name] = {'min': min(samples), 'median': statistics.median(samples)}
+
+    results: Dict[str, Any] = {
+        'python': sys.version.split()[0],
+        'repeat': repeat,
+        'files': {'startup': timings},
+    }
+    save_results(results, output, save_baseline)
+    if importtime:
+        click.echo('\n{:>12} {:>12}  {}'.format('累计(ms)', '自身(ms)', '模块'))
+        for cumulative, self_time, module in import_times(COMMANDS['--help']):
+            click.echo('{:>12.1f} {:>12.1f}  {}'.format(cumulative / 1000, self_time / 1000, module))
+
+    if baseline:
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
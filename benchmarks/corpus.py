@@ -0,0 +1,128 @@
+"""
+生成 [PackageList] 样例 PDF，作为解析器基准测试的输入，同时记录期望的字段值用于校验解析结果
+
+    python benchmarks/corpus.py ./data/bench_corpus
+"""
+
+import json
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+import fitz
+
+
+# 表格各列的起始字符位置（等宽字体）
+COLUMNS = [0, 7, 36, 52, 63]
+HEADERS = [
+    ['Item', 'Material / Customer Device', 'Lot No / Qty', 'Quantity', 'Remark'],
+    ['', 'Code', 'Sub', '(PCS)', ''],
+]
+
+# (名称, 页数, 每个 Item 的 Wafer 数, Item 数, TOTAL QUANTITY 是否在最后一页)
+DEFAULT_CASES = [
+    ('p1_w1', 1, 1, 1, False),
+    ('p1_w25', 1, 25, 1, False),
+    ('p1_w25_i4', 1, 25, 4, False),
+    ('p5_w13_i2', 5, 13, 2, False),
+    ('p20_w25_i3', 20, 25, 3, False),
+    ('p50_w25_i1', 50, 25, 1, False),
+    ('p50_w25_i6_tail', 50, 25, 6, True),
+]
+
+
+def _line(cells: List[str]) -> str:
+    line = ''
+    for start, cell in zip(COLUMNS, cells):
+        line = line.ljust(start) + cell
+    return line.rstrip()
+
+
+def make_package_list(pdf_file: str, pages: int = 1, wafers: int = 25, items: int = 1, total_on_last_page: bool = False, seed: int = 0) -> Dict[str, Any]:
+    """
+    生成一个 PackageList PDF，返回期望的解析结果:
+    {'Date', 'PO_No', 'Good_Qty', 'Device', 'OSAT_Device', 'Lot_No', 'Wafer_ID': [...], 'rows': 行数}
+    """
+
+    rand = random.Random(seed)
+    date = '2024-{:02d}-{:02d}'.format(rand.randint(1, 12), rand.randint(1, 28))
+    po_no = 'PO{:02d}{}{:05d}'.format(rand.randint(10, 99), rand.choice('NRE'), rand.randint(0, 99999))
+    lines = [
+        'PACKING LIST',
+        'DATE {}                      CTM ORDER NO. {}'.format(date, po_no),
+        '',
+        *[_line(header) for header in HEADERS],
+    ]
+
+    first = None
+    total = 0
+    for item in range(1, items + 1):
+        material = 'MAT{:03d}'.format(rand.randint(1, 999))
+        device = 'DEV-{}{:03d}'.format(rand.choice('ABC'), rand.randint(1, 999))
+        lot_no = 'LT{:04d}'.format(rand.randint(1, 9999))
+        start = rand.randint(1, 25 - wafers + 1) if wafers < 25 else 1
+        wafer_ids = [str(wafer) for wafer in range(start, start + wafers)]
+        total += wafers
+        if first is None:
+            first = {'Device': device, 'OSAT_Device': material, 'Lot_No': lot_no, 'Wafer_ID': wafer_ids}
+        lines.append(_line([str(item), f'{material} / {device}', f'{lot_no} / {wafers}', str(wafers), 'OK']))
+        lines.append(_line(['', f'{material}-{item:02d}', 'S{:02d}'.format(item)]))  # 续行
+        lines.append(_line(['', 'Wafer ID: #' + ','.join(wafer_ids)]))
+
+    total_lines = ['', '', 'TOTAL QUANTITY {} PC'.format(total)]
+    if not total_on_last_page:
+        lines.extend(total_lines)
+
+    pdf = fitz.open()
+    for page_no in range(pages):
+        page = pdf.new_page(width=842, height=595)
+        if page_no == 0:
+            page_lines = lines
+        else:
+            page_lines = ['APPENDIX PAGE {}'.format(page_no)] + ['{:>4}  remark {}'.format(idx, 'x' * rand.randint(10, 90)) for idx in range(40)]
+            if total_on_last_page and page_no == pages - 1:
+                page_lines = page_lines + total_lines
+        y = 40
+        for line in page_lines:
+            page.insert_text((30, y), line, fontname='cour', fontsize=9)
+            y += 12
+    if total_on_last_page and pages == 1:
+        page = pdf[0]
+        for line in total_lines:
+            page.insert_text((30, y), line, fontname='cour', fontsize=9)
+            y += 12
+    pdf.save(pdf_file)
+    pdf.close()
+
+    return {
+        'Date': date,
+        'PO_No': po_no,
+        'Good_Qty': str(total),
+        **first,
+        'rows': len(first['Wafer_ID']),
+    }
+
+
+def build_corpus(output_dir: str, cases=None) -> Dict[str, Dict[str, Any]]:
+    """
+    生成全部样例，期望结果保存到 output_dir/expected.json；返回 {文件名: 期望结果}
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    expected = {}
+    for seed, (name, pages, wafers, items, tail) in enumerate(cases or DEFAULT_CASES):
+        pdf_name = f'[PackageList]{name}.pdf'
+        expected[pdf_name] = make_package_list(os.path.join(output_dir, pdf_name), pages, wafers, items, tail, seed)
+    with open(os.path.join(output_dir, 'expected.json'), 'w', encoding='utf-8') as f:
+        json.dump(expected, f, ensure_ascii=False, indent=2)
+    return expected
+
+
+def load_corpus(corpus_dir: str) -> Dict[str, Dict[str, Any]]:
+    with open(os.path.join(corpus_dir, 'expected.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    build_corpus(sys.argv[1] if len(sys.argv) > 1 else './data/bench_corpus')
@@ -0,0 +1,53 @@
+"""
+基准测试结果的保存、输出和与基线对比
+
+结果格式: {'files': {分组: {项目: {'min': 秒, 'median': 秒}}}, ...}
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import click
+
+
+def save_results(results: Dict[str, Any], *paths: Optional[str]) -> None:
+    for path in paths:
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    click.echo('\n{:<32} {:<20} {:>12} {:>12}'.format('文件', '项目', 'min(ms)', 'median(ms)'))
+    for name, timings in results['files'].items():
+        for item, timing in timings.items():
+            click.echo('{:<32} {:<20} {:>12.3f} {:>12.3f}'.format(name, item, timing['min'] * 1000, timing['median'] * 1000))
+
+
+def compare(results: Dict[str, Any], baseline_file: str, threshold: float) -> List[str]:
+    """
+    输出对比报告，返回变慢超过 threshold 的项目
+    """
+
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = []
+    click.echo('\n{:<32} {:<20} {:>12} {:>12} {:>8}'.format('文件', '项目', '基线(ms)', '当前(ms)', '变化'))
+    for name, timings in results['files'].items():
+        for item, timing in timings.items():
+            base = baseline.get('files', {}).get(name, {}).get(item)
+            if not base:
+                click.echo('{:<32} {:<20} {:>12} {:>12.3f} {:>8}'.format(name, item, '-', timing['min'] * 1000, 'new'))
+                continue
+            ratio = timing['min'] / base['min'] - 1 if base['min'] else 0
+            flag = ''
+            if ratio > threshold:
+                flag = ' !'
+                regressions.append(f'{name} {item}: {ratio:+.1%}')
+            click.echo('{:<32} {:<20} {:>12.3f} {:>12.3f} {:>+8.1%}{}'.format(name, item, base['min'] * 1000, timing['min'] * 1000, ratio, flag))
+    if regressions:
+        click.echo('\n性能回退:\n  ' + '\n  '.join(regressions), err=True)
+    return regressions
@@ -19,12 +19,16 @@ setup(
         'pypdf[full]',
         'PyMuPDF',
         'pandas',
+        'numpy',
         'pyyaml',
         'openpyxl',
         'loguru',
         'click',
         'pystray',
     ],
+    extras_require={
+        'zstd': ['zstandard'],  # upload_server.bundle: tar.zst
+    },
     packages=find_packages(
         where='src',
         include='ptof*',
@@ -38,6 +42,10 @@ setup(
     entry_points={
         'console_scripts': [
             'cli-name = ptof:cli'
-        ]
+        ],
+        # 解析器按名称延迟导入，第三方包可在同一分组下注册自己的解析器
+        'ptof.parsers': [
+            'PackageList = ptof.pdf_parser.package_list:PackageListParser',
+        ],
     },
 )
\ No newline at end of file
@@ -0,0 +1,125 @@
+import asyncio
+import ftplib
+import imaplib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from ptof.logger import logger
+from ptof import tools
+
+
+# 队列结束标记
+_DONE = object()
+
+
+async def run_pipeline_async(config: dict, mail: imaplib.IMAP4 | None = None, executor=None, get_ftp: Callable[[], ftplib.FTP] | None = None,
+                             attachments: Iterable[dict] | None = None) -> int:
+    """
+    重叠执行的流水线：获取邮件（含保存附件）、解析写入、上传三个阶段同时运行，阶段之间用有界队列连接
+    - 获取邮件和上传的阻塞 IO 在各自的线程中执行，解析提交到 executor（进程池）
+    - 解析阶段每次取出队列中已就绪的附件（最多 parse_results.batch_size 个），第一批文件上传时后续邮件仍在下载
+    - 队列长度 pipeline.queue_size，下游变慢时上游等待，内存占用有上限
+    返回处理的附件数；参数含义与 tools.run_pipeline 相同（传入 attachments 时不连接 IMAP 服务器）
+    """
+
+    pipeline_config = dict(config.get('pipeline', {}) or {})
+    queue_size = max(1, int(pipeline_config.get('queue_size', 100)))
+    batch_size = max(1, int(config['parse_results'].get('batch_size', 50)))
+    files_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    upload_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size // batch_size))
+    counter = {'total': 0}
+
+    from ptof.ledger import open_ledger
+    ledger = open_ledger(config)
+    if ledger is not None and (written_files := ledger.written_outputs()):
+        logger.info('上传上次未完成上传的文件: {} 个', len(written_files))
+        await upload_queue.put(written_files)
+
+    tasks = [
+        asyncio.create_task(_fetch_stage(config, mail, files_queue, counter, attachments), name='fetch'),
+        asyncio.create_task(_parse_stage(config, executor, files_queue, upload_queue, batch_size), name='parse'),
+        asyncio.create_task(_upload_stage(config, get_ftp, upload_queue), name='upload'),
+    ]
+    try:
+        # 任一阶段失败时取消其它阶段，并抛出该异常
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if attachments is None:
+            await asyncio.to_thread(tools.finish_pipeline, config, mail)
+    return counter['total']
+
+
+async def _fetch_stage(config: dict, mail: imaplib.IMAP4 | None, files_queue: asyncio.Queue, counter: dict, source: Iterable[dict] | None = None) -> None:
+    loop = asyncio.get_running_loop()
+    # imaplib 连接不能跨线程并发使用，生成器的每一步都在同一个线程中执行
+    imap_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ptof-fetch')
+    attachments = tools.iter_pipeline_attachments(config, mail) if source is None else iter(source)
+    try:
+        while True:
+            attachment = await loop.run_in_executor(imap_executor, next, attachments, _DONE)
+            if attachment is _DONE:
+                break
+            counter['total'] += 1
+            await files_queue.put(attachment)
+    finally:
+        # 被取消时，排在正在执行的步骤之后关闭生成器（释放 IMAP 连接）
+        if hasattr(attachments, 'close'):
+            await loop.run_in_executor(imap_executor, attachments.close)
+        imap_executor.shutdown(wait=False)
+    await files_queue.put(_DONE)
+
+
+async def _parse_stage(config: dict, executor, files_queue: asyncio.Queue, upload_queue: asyncio.Queue, batch_size: int) -> None:
+    done = False
+    while not done:
+        files = [await files_queue.get()]
+        # 不等待凑满一批，取走队列中已就绪的附件即开始解析
+        while len(files) < batch_size and not files_queue.empty():
+            files.append(files_queue.get_nowait())
+        if files[-1] is _DONE:
+            files.pop()
+            done = True
+        if not files:
+            continue
+
+        logger.debug('解析阶段取到 {} 个附件', len(files))
+        upload_files = await asyncio.to_thread(tools.extract_pdf_to_excel, config, files, executor)
+        if not upload_files:
+            logger.warning("没有需要上传的文件")
+            continue
+        await upload_queue.put(upload_files)
+    await upload_queue.put(_DONE)
+
+
+async def _upload_stage(config: dict, get_ftp: Callable[[], ftplib.FTP] | None, upload_queue: asyncio.Queue) -> None:
+    from ptof.ledger import open_ledger
+    ledger = open_ledger(config)
+    ftp: Optional[ftplib.FTP] = None
+    try:
+        while (upload_files := await upload_queue.get()) is not _DONE:
+            if get_ftp is not None:
+                session = await asyncio.to_thread(get_ftp)
+            else:
+                ftp = ftp or await asyncio.to_thread(tools.connect_ftp, config)
+                session = ftp
+            await asyncio.to_thread(tools.upload_to_ftp, config, upload_files, session)
+            if ledger is not None:
+                ledger.mark_uploaded(upload_files)
+    finally:
+        if ftp is not None:
+            await asyncio.to_thread(ftp.quit)
+
+
+def run_pipeline(config: dict, mail: imaplib.IMAP4 | None = None, executor=None, get_ftp: Callable[[], ftplib.FTP] | None = None,
+                 attachments: Iterable[dict] | None = None) -> int:
+    """
+    同步入口，供命令行和常驻服务调用
+    """
+
+    return asyncio.run(run_pipeline_async(config, mail, executor, get_ftp, attachments))
@@ -0,0 +1,111 @@
+import os
+import io
+import importlib.util
+import json
+import tarfile
+import threading
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from ptof.cache import file_sha256
+from ptof.logger import logger
+
+
+FORMATS = ['zip', 'tar.zst']
+MANIFEST_NAME = 'manifest.json'
+
+# 输出文件 => 写入的行数，由 extract_pdf_to_excel 在关闭写入器时记录，打包时取出
+_rows: Dict[str, int] = {}
+_rows_lock = threading.Lock()
+
+
+def bundle_format(config: dict) -> Optional[str]:
+    """
+    upload_server.bundle 配置的打包格式，未配置时返回 None（逐个文件上传）；格式不支持或缺少依赖时抛出异常
+    """
+
+    fmt = (config.get('upload_server', {}) or {}).get('bundle') or None
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError('不支持的打包格式: {}, 可选: {}'.format(fmt, FORMATS))
+    if fmt == 'tar.zst' and importlib.util.find_spec('zstandard') is None:
+        raise RuntimeError('tar.zst 格式需要安装 zstandard: pip install ptof[zstd]')
+    return fmt
+
+
+def record_rows(output_file: str, rows: int) -> None:
+    with _rows_lock:
+        _rows[os.path.abspath(output_file)] = rows
+
+
+def file_rows(output_file: str) -> Optional[int]:
+    """
+    输出文件的数据行数：优先使用写入时记录的行数，否则读取文件统计（不含表头）
+    """
+
+    with _rows_lock:
+        rows = _rows.pop(os.path.abspath(output_file), None)
+    if rows is not None:
+        return rows
+    try:
+        from openpyxl import load_workbook
+        workbook = load_workbook(output_file, read_only=True)
+        try:
+            return max(0, sum(1 for _ in workbook.active.iter_rows(values_only=True)) - 1)
+        finally:
+            workbook.close()
+    except Exception as e:
+        logger.warning('统计文件 {} 的行数失败: {}', output_file, e)
+        return None
+
+
+def archive_name(file: str) -> str:
+    # 输出文件按解析器分目录保存，包内保留一级目录，避免不同解析器的同名文件冲突
+    return '/'.join([os.path.basename(os.path.dirname(os.path.abspath(file))), os.path.basename(file)])
+
+
+def build_manifest(files: Iterable[str], fmt: str) -> Dict[str, Any]:
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'format': fmt,
+        'files': [{
+            'name': archive_name(file),
+            'size': os.path.getsize(file),
+            'sha256': file_sha256(file),
+            'rows': file_rows(file),
+        } for file in files],
+    }
+
+
+def build_bundle(files: List[str], output_dir: str, fmt: str, prefix: str = 'ptof') -> str:
+    """
+    将本次输出的文件和 manifest.json（文件名、大小、SHA-256、行数）打包为一个文件，返回打包文件路径
+    """
+
+    files = list(dict.fromkeys(files))  # 合并输出时同一文件可能出现多次
+    os.makedirs(output_dir, exist_ok=True)
+    name = '{}_{}_{}.{}'.format(prefix, datetime.now().strftime('%Y%m%d%H%M%S%f'), os.getpid(), fmt)
+    bundle_file = os.path.join(output_dir, name)
+    manifest = json.dumps(build_manifest(files, fmt), ensure_ascii=False, indent=2).encode('utf-8')
+
+    if fmt == 'zip':
+        # xlsx 本身已压缩，只压缩 manifest
+        with zipfile.ZipFile(bundle_file, 'w', compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr(zipfile.ZipInfo(MANIFEST_NAME, datetime.now().timetuple()[:6]), manifest, compress_type=zipfile.ZIP_DEFLATED)
+            for file in files:
+                archive.write(file, archive_name(file))
+    else:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError('tar.zst 格式需要安装 zstandard: pip install ptof[zstd]') from e
+        with open(bundle_file, 'wb') as f, zstandard.ZstdCompressor().stream_writer(f) as compressed:
+            with tarfile.open(fileobj=compressed, mode='w|') as archive:
+                info = tarfile.TarInfo(MANIFEST_NAME)
+                info.size = len(manifest)
+                info.mtime = int(datetime.now().timestamp())
+                archive.addfile(info, io.BytesIO(manifest))
+                for file in files:
+                    archive.add(file, archive_name(file))
+    logger.info('{} 个文件已打包为 {}', len(files), bundle_file)
+    return bundle_file
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+from ptof.logger import logger
+
+
+def file_sha256(file: str | Path, block_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的 SHA-256
+    """
+
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def data_sha256(data: bytes | memoryview) -> str:
+    """
+    计算内存中 PDF 内容的 SHA-256，与 file_sha256 的结果一致
+    """
+
+    return hashlib.sha256(data).hexdigest()
+
+
+class ParseCache(object):
+    """
+    以 PDF 内容哈希 + 解析器名称 + 解析器版本为键的解析结果磁盘缓存
+    """
+
+    def __init__(self, path: str | Path, max_size_mb: float = 512, max_age_days: float = 30) -> None:
+        self.path = Path(path)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 24 * 3600
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["ParseCache"]:
+        cache_config = dict(config.get('cache', {}) or {})
+        if not cache_config.get('enabled', False):
+            return None
+        return cls(
+            cache_config.get('path', './data/cache/'),
+            cache_config.get('max_size_mb', 512),
+            cache_config.get('max_age_days', 30),
+        )
+
+    def key(self, pdf_hash: str, parser_name: str, parser_version: str) -> str:
+        return hashlib.sha256(f'{pdf_hash}:{parser_name}:{parser_version}'.encode('utf-8')).hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path.joinpath(key[:2], key + '.json')
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        返回 (是否命中, 解析结果)，解析结果可能为 None（解析为空也会缓存）
+        """
+
+        cache_file = self._file(key)
+        try:
+            if self.max_age and time.time() - cache_file.stat().st_mtime > self.max_age:
+                return (False, None)
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            if isinstance(result, dict) and 'headers' in result:
+                from ptof.pdf_parser.result import ColumnarResult
+                result = ColumnarResult.from_json(result)
+            os.utime(cache_file)  # 更新访问时间，淘汰时按最近使用排序
+        except FileNotFoundError:
+            return (False, None)
+        except (OSError, ValueError) as e:
+            logger.warning('缓存文件 {} 读取失败: {}', cache_file, e)
+            return (False, None)
+        return (True, result)
+
+    def put(self, key: str, result: Any) -> None:
+        cache_file = self._file(key)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，多个解析进程同时写入也不会读到半个文件
+        fd, tmp_file = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                # 列式结果按列保存，表头字段只保存一次
+                json.dump(result.to_json() if hasattr(result, 'to_json') else result, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+    def evict(self) -> int:
+        """
+        删除过期缓存，总大小超过上限时按最近使用时间从旧到新删除，返回删除的文件数
+        """
+
+        if not self.path.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for cache_file in self.path.glob('*/*.json'):
+            try:
+                stat = cache_file.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                cache_file.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, cache_file))
+
+        total_size = sum(size for _, size, _ in entries)
+        if self.max_size and total_size > self.max_size:
+            for _, size, cache_file in sorted(entries):
+                cache_file.unlink(missing_ok=True)
+                removed += 1
+                total_size -= size
+                if total_size <= self.max_size:
+                    break
+        if removed:
+            logger.info('清理解析缓存 {} 个文件', removed)
+        return removed
@@ -1,8 +1,12 @@
 import sys
-from ptof.logger import logger
+import os
+from ptof.logger import logger, log_init
 import click
-from ptof.tools import *
+from ptof.metrics import metrics, profile
 from pathlib import Path
+from contextlib import ExitStack
+
+# 较重的依赖（yaml、PyMuPDF、openpyxl 等）在命令内部导入，--help 和 show-config-file 不需要加载
 
 
 config_default_path = os.path.join(Path(os.path.dirname(__file__)), 'resources', 'config.yml')
@@ -14,10 +18,13 @@ def cli():
 
 @cli.command()
 @click.option("--config", type=click.Path(), default =config_default_path, help='配置文件的路径')
-def pipeline(config: click.Path):
+@click.option("--profile", "profile_file", type=click.Path(), default=None, help='保存 cProfile 性能分析结果的文件（只统计主进程）')
+@click.option("--mode", type=click.Choice(['batch', 'async']), default=None, help='batch: 按批依次获取、解析、上传; async: 各阶段重叠执行; 默认使用配置 pipeline.mode')
+def pipeline(config: click.Path, profile_file: click.Path, mode: str):
     """
     流程自动化
     """
+    from ptof.tools import load_config, parse_executor, get_pipeline_runner
     config_data = load_config(config)
     if 'demo' in config_data and config_data['demo']:
         print('样例配置文件不可用于实际业务')
@@ -25,36 +32,84 @@ def pipeline(config: click.Path):
 
     log_init(config_data)
     
-    # 获取符合条件的邮件
-    emails = fetch_emails(config_data)
+    # 流式处理：获取邮件、下载附件、解析、上传按批交替进行（async 模式下同时进行）
+    run_pipeline = get_pipeline_runner(config_data, mode)
+    try:
+        with profile(profile_file), parse_executor(config_data) as executor:
+            total = run_pipeline(config_data, executor=executor)
+    finally:
+        metrics.write(config_data)
     
-    if not emails:
-        logger.warning("没有需要处理的邮件")
+    if not total:
+        logger.warning("没有需要处理的邮件附件")
         sys.exit()
 
-    # 下载相关附件    
-    files = download_attachments(config_data, emails)
-    if not files:
-        logger.warning("邮件中没有找到需要处理的附件")
-        sys.exit()
-    
-    upload_files = extract_pdf_to_excel(config_data, files)  # 需要实现具体的PDF解析逻辑
-    if not upload_files:
-        logger.warning("没有需要上传的文件")
+
+@cli.command()
+@click.option("--config", type=click.Path(), default =config_default_path, help='配置文件的路径')
+def serve(config: click.Path):
+    """
+    常驻运行，监听新邮件并自动解析、同步到 FTP
+    """
+    from ptof.tools import load_config
+    config_data = load_config(config)
+    if 'demo' in config_data and config_data['demo']:
+        print('样例配置文件不可用于实际业务')
+        return
+
+    log_init(config_data)
+
+    from ptof.server import PipelineServer
+    PipelineServer(config_data).run()
+
+
+@cli.command()
+@click.option("--config", type=click.Path(), default =config_default_path, help='配置文件的路径')
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--profile", "profile_file", type=click.Path(), default=None, help='保存 cProfile 性能分析结果的文件（只统计主进程）')
+@click.option("--mode", type=click.Choice(['batch', 'async']), default=None, help='batch: 按批依次读取、解析、上传; async: 各阶段重叠执行; 默认使用配置 pipeline.mode')
+@click.option("--force", is_flag=True, default=False, help='忽略处理记录，重新处理已处理过的附件')
+def import_archive(config: click.Path, paths: tuple, profile_file: click.Path, mode: str, force: bool):
+    """
+    从本地 mbox 文件或 Maildir 目录导入邮件，按主题解析 PDF 附件并上传，不连接 IMAP 服务器
+    """
+    from ptof.tools import load_config, parse_executor, get_pipeline_runner, iter_attachments
+    from ptof.offline import iter_archive_parts
+    config_data = load_config(config)
+    if 'demo' in config_data and config_data['demo']:
+        print('样例配置文件不可用于实际业务')
+        return
+
+    log_init(config_data)
+
+    run_pipeline = get_pipeline_runner(config_data, mode)
+    try:
+        with profile(profile_file), parse_executor(config_data) as executor:
+            attachments = iter_attachments(config_data, iter_archive_parts(config_data, paths, force=force))
+            total = run_pipeline(config_data, executor=executor, attachments=attachments)
+    finally:
+        metrics.write(config_data)
+
+    if not total:
+        logger.warning("没有需要处理的邮件附件")
         sys.exit()
-    
-    upload_to_ftp(config_data, upload_files)
 
 
 @cli.command()
 @click.option("--config", type=click.Path(), default =config_default_path, help='配置文件的路径')
 @click.option("--pdf-dir", type=click.Path(), required=True, default ='', help='PDF文件所在目录')
-def parse_attachments(config: click.Path, pdf_dir: click.Path):
+@click.option("--profile", "profile_file", type=click.Path(), default=None, help='保存 cProfile 性能分析结果的文件（只统计主进程）')
+@click.option("--recursive/--no-recursive", default=None, help='是否包含子目录，默认使用配置 local.recursive')
+@click.option("--watch", is_flag=True, default=False, help='处理完现有文件后继续监听目录，新文件写入完成后自动解析上传')
+@click.option("--force", is_flag=True, default=False, help='忽略已处理文件索引，重新处理全部文件')
+def parse_attachments(config: click.Path, pdf_dir: click.Path, profile_file: click.Path, recursive: bool, watch: bool, force: bool):
     """
     解析并上传指定目录下的 pdf 文件
     """
 
-    import glob, re as regex
+    from concurrent.futures.process import BrokenProcessPool
+    from ptof.tools import load_config, process_local_files, parse_executor, create_parse_executor
+    from ptof.watch import DirectoryWatcher, FileIndex, scan_files, stat_files
     config_info = load_config(config)
     if 'demo' in config_info and config_info['demo']:
         print('样例配置文件不可用于实际业务')
@@ -62,31 +117,64 @@ def parse_attachments(config: click.Path, pdf_dir: click.Path):
 
     log_init(config_info)
 
-    raw_files = glob.glob(os.path.join(str(pdf_dir), '*' + config_info['attachments']['file_ext']))
-    match = regex.compile('^\[([^\[\]]+)\]') # type: ignore
-    files = []
-    for raw_file in raw_files:
-        raw_filename = os.path.basename(raw_file)
-        logger.debug('File Name {} From {}', raw_filename, raw_file)
-        search = match.search(raw_filename)
-        if search:
-            logger.debug('Search Result {} From {}', search, raw_file)
-            files.append({
-                'subject': search[0] + 'From Local Path',
-                'dl_file': raw_file,
-                'from': 'local@local.com',
-                'to': 'local@local.com',
-                'attachment_file_name': raw_filename,
-            })
-        else:
-            logger.warning("文件 {} 没有匹配到主题，跳过", raw_file)
-
-    upload_files = extract_pdf_to_excel(config_info, files)  # 需要实现具体的PDF解析逻辑
-    if not upload_files:
+    local_config = dict(config_info.get('local', {}) or {})
+    recursive = local_config.get('recursive', False) if recursive is None else recursive
+    file_ext = config_info['attachments']['file_ext']
+    index = FileIndex.from_config(config_info)
+
+    upload_files = []
+    watcher = None
+    try:
+        # 先开始监听再扫描，扫描期间写入的文件不会遗漏（重复的由索引过滤）
+        watcher = DirectoryWatcher(str(pdf_dir), file_ext, recursive, float(local_config.get('poll_interval', 5))) if watch else None
+        with profile(profile_file), ExitStack() as stack:
+            executor = stack.enter_context(parse_executor(config_info)) if watch else None
+            files = list(scan_files(str(pdf_dir), file_ext, recursive))
+            if index is not None and not force:
+                scanned = len(files)
+                files = index.changed(files)
+                logger.info('目录中共 {} 个文件，新增或有变化的 {} 个', scanned, len(files))
+            upload_files = process_local_files(config_info, files, executor, index)
+
+            if watcher is not None:
+                logger.info('开始监听目录 {}，按 Ctrl+C 退出', pdf_dir)
+                debounce = float(local_config.get('debounce', 1.0))
+                with watcher:
+                    while True:
+                        paths = watcher.wait(3600)
+                        if not paths:
+                            continue
+                        # 短时间内陆续写入的文件合并为一批处理
+                        while more := watcher.wait(debounce):
+                            paths.extend(more)
+                        files = stat_files(dict.fromkeys(paths))
+                        if index is not None:
+                            files = index.changed(files)
+                        if not files:
+                            continue
+                        logger.info('检测到新文件 {} 个', len(files))
+                        try:
+                            process_local_files(config_info, files, executor, index)
+                        except BrokenProcessPool as e:
+                            # 解析进程异常退出后进程池不能再使用，重新创建后继续监听
+                            logger.exception('解析进程池已损坏, 重新创建: {}', e)
+                            executor = stack.enter_context(create_parse_executor(config_info))
+                        except Exception as e:
+                            # 单批失败（如上传服务器不可用）不结束监听，未上传的文件不会记入索引，下次启动时重新处理
+                            logger.exception('处理新文件失败, 继续监听: {}', e)
+                        metrics.write(config_info)
+    except KeyboardInterrupt:
+        if watcher is None:
+            raise
+        logger.info('停止监听目录 {}', pdf_dir)
+    finally:
+        metrics.write(config_info)
+        if index is not None:
+            index.close()
+
+    if not upload_files and not watch:
         logger.warning("没有需要上传的文件")
         sys.exit()
-    
-    upload_to_ftp(config_info, upload_files)
 
 
 @cli.command
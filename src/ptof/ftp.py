@@ -0,0 +1,114 @@
+import os
+import ftplib
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+from ptof.logger import logger
+
+
+class FTPPool(object):
+    """
+    有上限的 FTP 会话池，按需创建连接；外部传入的连接只借用不关闭
+    """
+
+    def __init__(self, connect: Callable[[], ftplib.FTP], size: int, borrowed: Optional[ftplib.FTP] = None) -> None:
+        self.connect = connect
+        self.size = max(1, int(size))
+        self.idle: queue.Queue = queue.Queue()
+        self.created: List[ftplib.FTP] = []
+        self.borrowed = borrowed
+        self.lock = threading.Lock()
+        if borrowed is not None:
+            self.idle.put(borrowed)
+
+    def acquire(self) -> ftplib.FTP:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            count = len(self.created) + (1 if self.borrowed is not None else 0)
+            can_create = count < self.size
+        if not can_create:
+            return self.idle.get()
+        ftp = self.connect()
+        with self.lock:
+            self.created.append(ftp)
+        return ftp
+
+    def release(self, ftp: ftplib.FTP) -> None:
+        self.idle.put(ftp)
+
+    def discard(self, ftp: ftplib.FTP) -> None:
+        """
+        丢弃已断开的连接，下次 acquire 时重新创建
+        """
+
+        try:
+            ftp.close()
+        except ftplib.all_errors:
+            pass
+        with self.lock:
+            if ftp is self.borrowed:
+                self.borrowed = None
+            elif ftp in self.created:
+                self.created.remove(ftp)
+
+    def close(self) -> None:
+        with self.lock:
+            created, self.created = self.created, []
+        for ftp in created:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+
+def list_remote_sizes(ftp: ftplib.FTP, names: List[str]) -> Dict[str, int]:
+    """
+    一次列出远程目录的文件大小：优先 MLSD，服务器不支持时 NLST 后只对本次要上传的文件发送 SIZE
+    """
+
+    sizes = {}
+    try:
+        for name, facts in ftp.mlsd(facts=['type', 'size']):
+            if facts.get('type', 'file') == 'file' and 'size' in facts:
+                sizes[name] = int(facts['size'])
+        return sizes
+    except ftplib.error_perm as e:
+        logger.debug('FTP 服务器不支持 MLSD, 改用 NLST: {}', e)
+
+    try:
+        remote_names = set(os.path.basename(name) for name in ftp.nlst())
+    except ftplib.error_perm:
+        # 空目录时部分服务器返回 550
+        return sizes
+    for name in names:
+        if name in remote_names:
+            size = remote_size(ftp, name)
+            if size is not None:
+                sizes[name] = size
+    return sizes
+
+
+def remote_size(ftp: ftplib.FTP, name: str) -> Optional[int]:
+    try:
+        ftp.voidcmd('TYPE I')  # SIZE 需在二进制模式下返回准确字节数
+        return ftp.size(name)
+    except ftplib.error_perm:
+        return None
+
+
+def upload_file(ftp: ftplib.FTP, file: str, blocksize: int = 8192, offset: int = 0, remote_name: Optional[str] = None) -> None:
+    """
+    上传单个文件，offset > 0 时通过 REST 从断点续传；remote_name 默认为本地文件名
+    """
+
+    file_name = remote_name or os.path.basename(file)
+    with open(file, 'rb') as f:
+        if offset:
+            f.seek(offset)
+            ftp.storbinary(f'STOR {file_name}', f, blocksize, rest=offset)
+        else:
+            ftp.storbinary(f'STOR {file_name}', f, blocksize)
@@ -0,0 +1,319 @@
+import re
+import time
+import select
+import ssl
+import base64
+import quopri
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ptof.logger import logger
+from ptof.metrics import metrics
+
+
+# IMAP 响应中的词法单元: 括号、带引号字符串、字面量标记 {n}、原子（含 BODY[...]<...> 形式）
+_token_regex = re.compile(
+    rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}\s*$|([^\s()"\[\]]+(?:\[[^\]]*\](?:<[^>]*>)?)?))'
+)
+
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT MESSAGE-ID)]'
+
+_idle_new_mail_regex = re.compile(rb'\* \d+ (EXISTS|RECENT)')
+
+
+def chunks(items: List, size: int) -> Iterator[List]:
+    """
+    按固定大小切分列表，避免单条命令过长
+    """
+
+    size = max(1, int(size))
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _tokenize(data: List[Any]) -> Iterator[Any]:
+    """
+    将 imaplib 返回的 data 列表转换为词法单元流，字面量直接作为 bytes 返回
+    """
+
+    for item in data:
+        if item is None:
+            continue
+        head, literal = item if isinstance(item, tuple) else (item, None)
+        pos = 0
+        while pos < len(head):
+            mo = _token_regex.match(head, pos)
+            if not mo or mo.end() == pos:
+                break
+            pos = mo.end()
+            if mo.group(1):
+                yield '('
+            elif mo.group(2):
+                yield ')'
+            elif mo.group(3) is not None:
+                yield re.sub(rb'\\(.)', rb'\1', mo.group(3))
+            elif mo.group(4) is not None:
+                yield literal if literal is not None else b''
+            elif mo.group(5) is not None:
+                atom = mo.group(5)
+                yield None if atom.upper() == b'NIL' else atom.decode('ascii', 'replace')
+
+
+def _read_value(tokens: Iterator[Any], token: Any) -> Any:
+    if token == '(':
+        values = []
+        for next_token in tokens:
+            if next_token == ')':
+                break
+            values.append(_read_value(tokens, next_token))
+        return values
+    return token
+
+
+def parse_fetch_response(data: List[Any]) -> List[Dict[str, Any]]:
+    """
+    解析 FETCH 响应，返回 [{'UID': '12', 'BODYSTRUCTURE': [...], 'BODY[2]': b'...'}, ...]
+    """
+
+    responses = []
+    tokens = _tokenize(data)
+    for token in tokens:
+        if token == '(' or token == ')':
+            continue
+        # token 为消息序号，紧接着是数据项列表
+        items = _read_value(tokens, next(tokens, None))
+        if not isinstance(items, list):
+            continue
+        response = {}
+        for idx in range(0, len(items) - 1, 2):
+            key = str(items[idx]).upper().replace('BODY.PEEK[', 'BODY[')
+            response[key] = items[idx + 1]
+        responses.append(response)
+    return responses
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def _params(value: Any) -> Dict[str, str]:
+    params = {}
+    if isinstance(value, list):
+        for idx in range(0, len(value) - 1, 2):
+            params[_text(value[idx]).lower()] = _text(value[idx + 1])
+    return params
+
+
+def _filename(params: Dict[str, str]) -> Optional[str]:
+    for key in ('filename', 'name'):
+        if key in params:
+            # RFC 2047: =?utf-8?B?...?=
+            return str(make_header(decode_header(params[key])))
+        if key + '*' in params:
+            # RFC 2231: utf-8''%E4%B8%AD.pdf
+            charset, _, value = decode_rfc2231(params[key + '*'])
+            return unquote(value, encoding=charset or 'utf-8', errors='replace')
+    return None
+
+
+def walk_bodystructure(structure: List, prefix: str = '') -> Iterator[Dict[str, Any]]:
+    """
+    遍历 BODYSTRUCTURE，返回每个叶子部分的 part 编号、类型、编码和附件名
+    """
+
+    if not structure:
+        return
+    if isinstance(structure[0], list):
+        # multipart: 子部分依次编号 1, 2, ...，最后为子类型和扩展字段
+        num = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            num += 1
+            yield from walk_bodystructure(child, f'{prefix}.{num}' if prefix else str(num))
+        return
+
+    main_type = _text(structure[0]).lower()
+    sub_type = _text(structure[1]).lower()
+    params = _params(structure[2])
+    # 扩展字段位置: text 类型多一个行数字段，message/rfc822 多信封、正文、行数
+    ext_offset = 7
+    if main_type == 'text':
+        ext_offset = 8
+    elif main_type == 'message' and sub_type == 'rfc822':
+        ext_offset = 10
+    disposition = structure[ext_offset + 1] if len(structure) > ext_offset + 1 else None
+    if isinstance(disposition, list) and len(disposition) > 1:
+        params = {**params, **_params(disposition[1])}
+
+    yield {
+        'part': prefix or '1',
+        'content_type': f'{main_type}/{sub_type}',
+        'encoding': _text(structure[5]).lower(),
+        'size': int(structure[6]) if structure[6] and str(structure[6]).isdigit() else 0,
+        'filename': _filename(params),
+    }
+
+
+def select_parts(structure: List, file_ext: str) -> List[Dict[str, Any]]:
+    """
+    从 BODYSTRUCTURE 中挑选需要下载的附件部分：application/pdf 或附件名后缀匹配
+    """
+
+    config_file_ext = file_ext.split('.')[-1].lower()
+    parts = []
+    for part in walk_bodystructure(structure):
+        filename = part['filename']
+        if filename:
+            if filename.split('.')[-1].lower() == config_file_ext:
+                parts.append(part)
+            else:
+                logger.debug('附件 {} 后缀和预期 {} 不匹配, 跳过', filename, config_file_ext)
+        elif part['content_type'] == 'application/pdf':
+            parts.append(part)
+    return parts
+
+
+def decode_payload(payload: bytes, encoding: str) -> bytes:
+    """
+    按 Content-Transfer-Encoding 解码附件内容
+    """
+
+    if encoding == 'base64':
+        return base64.b64decode(payload)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(payload)
+    return payload
+
+
+def iter_pdf_part_batches(mail, uids: List[bytes], file_ext: str, batch_size: int = 200, skip: Optional[Callable[[Dict[str, Any], Dict[str, Any]], bool]] = None) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+    """
+    按 UID 分批：批量获取 BODYSTRUCTURE 和邮件头，再按 part 编号合并 UID 集合，只下载 PDF 部分
+    每批返回 (uid 列表, PDF 部分列表)，内存占用只与 batch_size 相关
+    skip(邮件, 部分) 返回 True 的部分不下载，如已处理过的附件
+    """
+
+    for uid_batch in chunks([uid.decode() if isinstance(uid, bytes) else str(uid) for uid in uids], batch_size):
+        with metrics.timer('imap_fetch') as record:
+            record['count'] = len(uid_batch)
+            messages: Dict[str, Dict[str, Any]] = {}
+            status, data = mail.uid('FETCH', ','.join(uid_batch), f'(UID BODYSTRUCTURE {HEADER_FIELDS})')
+            if status != 'OK':
+                logger.warning('获取邮件结构失败: {}', status)
+                continue
+            record['bytes'] = sum(len(item[1]) for item in data if isinstance(item, tuple))
+            for response in parse_fetch_response(data):
+                uid = _text(response.get('UID'))
+                header = next((value for key, value in response.items() if key.upper().startswith('BODY[HEADER')), None) or b''  # 服务器返回的字段列表格式不一定与请求一致
+                messages[uid] = {
+                    'uid': uid,
+                    'header': BytesParser().parsebytes(header, headersonly=True),
+                    'parts': select_parts(response.get('BODYSTRUCTURE') or [], file_ext),
+                }
+                if skip is not None:
+                    messages[uid]['parts'] = [ part for part in messages[uid]['parts'] if not skip(messages[uid], part) ]
+
+            # 同一 part 编号的 UID 合并为一条 FETCH 命令
+            part_uids: Dict[str, List[str]] = {}
+            for uid, message in messages.items():
+                for part in message['parts']:
+                    part_uids.setdefault(part['part'], []).append(uid)
+
+            payloads: Dict[Tuple[str, str], bytes] = {}
+            for part_no, part_uid_list in part_uids.items():
+                status, data = mail.uid('FETCH', ','.join(part_uid_list), f'(UID BODY.PEEK[{part_no}])')
+                if status != 'OK':
+                    logger.warning('获取附件失败: {}, part: {}', status, part_no)
+                    continue
+                record['bytes'] += sum(len(item[1]) for item in data if isinstance(item, tuple))
+                for response in parse_fetch_response(data):
+                    payloads[(_text(response.get('UID')), part_no)] = response.get(f'BODY[{part_no}]') or b''
+
+            pdf_parts = []
+            for uid, message in messages.items():
+                for part in message['parts']:
+                    if (uid, part['part']) not in payloads:
+                        continue
+                    pdf_parts.append({
+                        **part,
+                        'uid': uid,
+                        'header': message['header'],
+                        'payload': payloads.pop((uid, part['part'])),
+                    })
+        yield uid_batch, pdf_parts
+
+
+def mark_seen(mail, uids: Iterable[str], batch_size: int = 200) -> None:
+    """
+    批量标记邮件为已读
+    """
+
+    for uid_batch in chunks(list(uids), batch_size):
+        mail.uid('STORE', ','.join(uid_batch), '+FLAGS', '(\\Seen)')
+
+
+def supports_idle(mail) -> bool:
+    return 'IDLE' in getattr(mail, 'capabilities', ())
+
+
+def _peek_buffered(mail) -> bytes:
+    """
+    不阻塞地查看 imaplib 读缓冲（mail.file）中已有的数据：一次收到多行时，后面的行已在缓冲中，select 感知不到
+    缓冲为空时以非阻塞方式尝试读取一次（同时取出 SSL 层已解密的数据），没有数据返回 b''
+    """
+
+    sock = mail.sock
+    sock_timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return mail.file.peek() or b''
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return b''
+    finally:
+        sock.settimeout(sock_timeout)
+
+
+def idle(mail, timeout: float, stop_event=None, tick: float = 1.0) -> bool:
+    """
+    进入 IDLE 等待服务器推送，收到 EXISTS/RECENT 时返回 True，超时或收到退出信号返回 False
+    imaplib (3.11) 未提供 IDLE，这里直接收发原始命令
+    """
+
+    tag = mail._new_tag()
+    mail.send(tag + b' IDLE\r\n')
+    line = mail.readline()
+    if not line.startswith(b'+'):
+        raise mail.error('IDLE 命令失败: {!r}'.format(line))
+
+    has_new = False
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            if stop_event is not None and stop_event.is_set():
+                break
+            # 已在读缓冲或 SSL 层中的数据不会被 select 感知，先查看缓冲
+            if not _peek_buffered(mail) and not select.select([mail.sock], [], [], tick)[0]:
+                continue
+            line = mail.readline()
+            if not line:
+                raise mail.abort('IDLE 期间连接被关闭')
+            logger.debug('IDLE 收到: {!r}', line)
+            if _idle_new_mail_regex.match(line):
+                has_new = True
+                break
+    finally:
+        mail.send(b'DONE\r\n')
+        while True:
+            line = mail.readline()
+            if not line:
+                raise mail.abort('结束 IDLE 时连接被关闭')
+            if line.startswith(tag):
+                break
+    return has_new
@@ -0,0 +1,188 @@
+import os
+import json
+import shutil
+import signal
+import time
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ptof.logger import logger
+
+
+# 失败原因
+TIMEOUT = 'timeout'
+MEMORY = 'memory'
+ERROR = 'error'
+CRASHED = 'crashed'
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# 子进程返回结果后等待其正常退出的时间（秒），超过后才强制结束
+EXIT_TIMEOUT = 5
+
+
+def parse_limits(config: dict) -> Dict[str, Any]:
+    """
+    parse_results.limits: 单个文件的解析时间（秒）和内存（MB）上限，均为 0 时不隔离
+    """
+
+    limits = dict((config.get('parse_results', {}) or {}).get('limits', {}) or {})
+    return {
+        'timeout': float(limits.get('timeout', 0) or 0),
+        'memory_mb': float(limits.get('memory_mb', 0) or 0),
+        'quarantine_path': limits.get('quarantine_path') or './data/quarantine/',
+    }
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """
+    进程的常驻内存（Linux /proc），其它系统返回 None
+    """
+
+    try:
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def group_rss_bytes(pgid: int) -> Optional[int]:
+    """
+    进程组内全部进程（解析进程及其页面提取进程等）的常驻内存之和（Linux /proc），其它系统返回 None
+    """
+
+    try:
+        pids = [name for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                stat = f.read()
+            # 进程名可能包含空格和括号，从最后一个 ")" 之后取: 状态 父进程 进程组
+            if int(stat[stat.rindex(b')') + 2:].split()[2]) != pgid:
+                continue
+        except (OSError, ValueError, IndexError):
+            continue
+        total += rss_bytes(int(pid)) or 0
+    return total
+
+
+def kill_group(process) -> None:
+    """
+    结束子进程及其创建的进程（同一进程组），不支持进程组的系统只结束子进程
+    """
+
+    if hasattr(os, 'killpg') and process.pid is not None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    if process.is_alive():
+        process.kill()
+
+
+def _child(conn, func: Callable, args: tuple, initializer: Optional[Callable], initargs: tuple) -> None:
+    if hasattr(os, 'setsid'):
+        # 单独的进程组：超时或超内存时连同页面提取进程池等一起结束，内存也按整个进程组统计
+        os.setsid()
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+        result = func(*args)
+    except MemoryError:
+        conn.send((MEMORY, 'MemoryError'))
+    except BaseException as e:
+        conn.send((ERROR, '{}: {}'.format(type(e).__name__, e)))
+    else:
+        conn.send((None, result))
+    finally:
+        conn.close()
+
+
+def run_isolated(func: Callable, tasks: Sequence[tuple], workers: int, timeout: float = 0, memory_mb: float = 0,
+                 initializer: Optional[Callable] = None, initargs: tuple = (), tick: float = 0.2) -> List[Tuple[Optional[str], Any, float]]:
+    """
+    每个任务在单独的子进程（进程组）中执行，同时最多 workers 个；超时或整个进程组的常驻内存超过上限时结束该进程组
+    按任务顺序返回 [(失败原因或 None, 结果或错误信息, 耗时), ...]，单个任务失败不影响其它任务
+    """
+
+    if memory_mb and rss_bytes(os.getpid()) is None:
+        logger.warning('当前系统不支持统计子进程内存，解析内存上限不生效')
+    memory_limit = int(memory_mb * 1024 * 1024)
+    context = multiprocessing.get_context()
+    outcomes: List[Optional[Tuple[Optional[str], Any, float]]] = [None] * len(tasks)
+    pending = list(range(len(tasks)))
+    running: Dict[int, tuple] = {}  # 任务序号 => (进程, 管道, 开始时间)
+
+    def finish(idx: int, reason: Optional[str], value: Any, kill: bool = True) -> None:
+        process, conn, start = running.pop(idx)
+        if not kill:
+            # 已返回结果的子进程自行退出（同时关闭页面提取进程池），不强制结束，避免其正在写文件时被中断
+            process.join(EXIT_TIMEOUT)
+            if process.is_alive():
+                logger.warning('子进程 {} 返回结果后 {} 秒内没有退出，强制结束', process.pid, EXIT_TIMEOUT)
+                kill = True
+        if kill:
+            kill_group(process)
+        process.join()
+        conn.close()
+        outcomes[idx] = (reason, value, time.perf_counter() - start)
+
+    try:
+        while pending or running:
+            while pending and len(running) < max(1, workers):
+                idx = pending.pop(0)
+                parent_conn, child_conn = context.Pipe(duplex=False)
+                # 不能使用 daemon：daemon 进程不能再创建子进程（page_parallel 的页面提取进程池）
+                process = context.Process(target=_child, args=(child_conn, func, tasks[idx], initializer, initargs))
+                process.start()
+                child_conn.close()
+                running[idx] = (process, parent_conn, time.perf_counter())
+
+            ready = wait([conn for _, conn, _ in running.values()], timeout=tick)
+            now = time.perf_counter()
+            for idx in list(running.keys()):
+                process, conn, start = running[idx]
+                if conn in ready:
+                    try:
+                        reason, value = conn.recv()  # 先读取结果再等待进程退出，避免结果较大时管道阻塞
+                    except EOFError:
+                        # 进程异常退出（如 PyMuPDF 崩溃或被系统结束），清理进程组中残留的进程
+                        process.join()
+                        finish(idx, CRASHED, 'exitcode {}'.format(process.exitcode))
+                    else:
+                        finish(idx, reason, value, kill=False)
+                elif timeout and now - start > timeout:
+                    finish(idx, TIMEOUT, '超过 {} 秒'.format(timeout))
+                elif memory_limit and (rss := group_rss_bytes(process.pid)) and rss > memory_limit:
+                    finish(idx, MEMORY, '常驻内存 {:.0f} MB 超过 {:.0f} MB'.format(rss / 1024 / 1024, memory_mb))
+    finally:
+        for idx in list(running.keys()):
+            finish(idx, CRASHED, '已取消')
+    return outcomes  # type: ignore[return-value]
+
+
+def quarantine(quarantine_path: str, pdf_file: str | Path, data: Optional[bytes], record: Dict[str, Any]) -> str:
+    """
+    将解析失败的 PDF 移动到隔离目录（内存中的附件直接写入），并在旁边写入同名 .json 失败记录，返回隔离后的路径
+    """
+
+    os.makedirs(quarantine_path, exist_ok=True)
+    name = '{}_{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), os.path.basename(str(pdf_file)))
+    target = os.path.join(quarantine_path, name)
+    if data is not None:
+        with open(target, 'wb') as f:
+            f.write(data)
+    elif os.path.exists(pdf_file):
+        shutil.move(str(pdf_file), target)
+    else:
+        logger.warning('待隔离的文件 {} 不存在，只写入失败记录', pdf_file)
+    record = dict(record, file=str(pdf_file), quarantine_file=target, quarantined_at=datetime.now().isoformat(timespec='seconds'))
+    with open(target + '.json', 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return target
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ptof.logger import logger
+
+
+# 附件处理状态，按先后顺序；skipped 表示没有可用的解析器或解析结果为空，与 uploaded 一样视为处理完成
+STATES = ['fetched', 'saved', 'parsed', 'written', 'uploaded']
+DONE_STATES = ('uploaded', 'skipped')
+
+COLUMNS = ['source', 'folder', 'mailbox', 'uid', 'part', 'message_id', 'subject', 'sender', 'recipient',
+           'filename', 'dl_file', 'output_file', 'flagged', 'error']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    key TEXT PRIMARY KEY,
+    source TEXT,
+    folder TEXT,
+    mailbox TEXT,
+    uid TEXT,
+    part TEXT,
+    message_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipient TEXT,
+    filename TEXT,
+    dl_file TEXT,
+    output_file TEXT,
+    state TEXT NOT NULL,
+    flagged INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attachments_message_id ON attachments (message_id);
+CREATE INDEX IF NOT EXISTS attachments_mailbox_uid ON attachments (mailbox, uid);
+CREATE INDEX IF NOT EXISTS attachments_state ON attachments (state, flagged);
+CREATE INDEX IF NOT EXISTS attachments_output_file ON attachments (output_file);
+"""
+
+
+class Ledger(object):
+    """
+    附件处理记录（SQLite）：fetched => saved => parsed => written => uploaded
+    - 重新运行时从每个附件最后完成的阶段继续，不再整批重做
+    - 邮件的全部附件上传成功（或跳过）后才标记已读
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        output_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(output_dir, exist_ok=True)
+        # 获取邮件的线程、流水线各阶段共用一个连接，由锁保证串行
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def key(mailbox: str, uid: str, part: str) -> str:
+        return f'{mailbox}:{uid}:{part}'
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+    def record(self, key: str, state: str, **fields: Any) -> None:
+        """
+        新增或更新一个附件的状态，未传入的字段保持不变
+        """
+
+        with self.lock:
+            self._upsert(key, state, fields)
+
+    def record_many(self, records: Iterable[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """
+        在一个事务中写入多条 (key, state, fields)
+        """
+
+        with self.lock:
+            self.db.execute('BEGIN')
+            try:
+                for key, state, fields in records:
+                    self._upsert(key, state, fields)
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    def mark_saved(self, key: str, **fields: Any) -> None:
+        """
+        附件已写入归档目录：记录 dl_file 等字段，仍为 fetched 时改为 saved
+        异步归档完成时附件可能已经解析或写入 Excel，此时状态保持不变
+        """
+
+        with self.lock:
+            row = self.db.execute('SELECT state FROM attachments WHERE key = ?', [key]).fetchone()
+            state = 'saved' if row is None or row['state'] == 'fetched' else row['state']
+            self._upsert(key, state, fields)
+
+    def _upsert(self, key: str, state: str, fields: Dict[str, Any]) -> None:
+        fields = { name: str(value) if isinstance(value, Path) else value for name, value in fields.items() if name in COLUMNS and value is not None }
+        names = ['key', 'state', 'created_at', 'updated_at', *fields.keys()]
+        updates = ', '.join(['state = excluded.state', 'updated_at = excluded.updated_at', *[f'{name} = excluded.{name}' for name in fields.keys()]])
+        now = time.time()
+        self.db.execute(
+            'INSERT INTO attachments ({}) VALUES ({}) ON CONFLICT(key) DO UPDATE SET {}'.format(', '.join(names), ', '.join(['?'] * len(names)), updates),
+            [key, state, now, now, *fields.values()],
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.db.execute('SELECT * FROM attachments WHERE key = ?', [key]).fetchone()
+        return dict(row) if row else None
+
+    def _rows(self, sql: str, args: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, list(args)).fetchall()]
+
+    def skip_part(self, mailbox: str, uid: str, part: str, message_id: Optional[str] = None) -> bool:
+        """
+        附件是否无需重新下载：已处理完成，或已保存到本地（由 resume_attachments 继续处理）
+        同一封邮件（Message-ID 相同）在其它目录中处理完成的附件同样跳过
+        """
+
+        row = self.get(self.key(mailbox, uid, part))
+        if row is not None:
+            if row['state'] in DONE_STATES:
+                return True
+            if row['state'] != 'fetched' and row['dl_file'] and os.path.exists(row['dl_file']):
+                return True
+        if message_id:
+            return bool(self._rows(
+                'SELECT 1 FROM attachments WHERE message_id = ? AND part = ? AND state IN (?, ?) LIMIT 1',
+                [message_id, part, *DONE_STATES],
+            ))
+        return False
+
+    def processed(self, message_id: Optional[str] = None, mailbox: Optional[str] = None, uid: Optional[str] = None) -> bool:
+        """
+        按 Message-ID 或 (邮箱目录, UID) 查询邮件是否已处理完成（全部附件已上传或跳过）
+        """
+
+        if message_id:
+            rows = self._rows('SELECT state FROM attachments WHERE message_id = ?', [message_id])
+        else:
+            rows = self._rows('SELECT state FROM attachments WHERE mailbox = ? AND uid = ?', [mailbox, uid])
+        return bool(rows) and all(row['state'] in DONE_STATES for row in rows)
+
+    def message_done(self, mailbox: str, uid: str) -> bool:
+        """
+        邮件没有未完成的附件（包括没有任何附件记录）
+        """
+
+        return not self._rows(
+            'SELECT 1 FROM attachments WHERE mailbox = ? AND uid = ? AND state NOT IN (?, ?) LIMIT 1',
+            [mailbox, uid, *DONE_STATES],
+        )
+
+    def pending_uids(self, mailbox: str) -> List[str]:
+        """
+        目录中还有未完成附件的邮件 UID
+        """
+
+        rows = self._rows('SELECT DISTINCT uid FROM attachments WHERE mailbox = ? AND state NOT IN (?, ?)', [mailbox, *DONE_STATES])
+        return [row['uid'] for row in rows]
+
+    def resume_attachments(self) -> List[Dict[str, Any]]:
+        """
+        已保存到本地但未写入 Excel 的附件（写入的 Excel 丢失的也重新解析），格式与 tools.iter_attachments 相同
+        """
+
+        attachments = []
+        for row in self._rows("SELECT * FROM attachments WHERE state IN ('saved', 'parsed', 'written') ORDER BY created_at"):
+            if row['state'] == 'written' and row['output_file'] and os.path.exists(row['output_file']):
+                continue
+            if not row['dl_file'] or not os.path.exists(row['dl_file']):
+                continue
+            attachments.append({
+                'from': row['sender'] or '',
+                'to': row['recipient'] or '',
+                'subject': row['subject'] or '',
+                'dl_file': Path(row['dl_file']),
+                'attachment_file_name': row['filename'],
+                'ledger_key': row['key'],
+            })
+        return attachments
+
+    def written_outputs(self) -> List[str]:
+        """
+        已写入但未上传的 Excel 文件
+        """
+
+        rows = self._rows("SELECT DISTINCT output_file FROM attachments WHERE state = 'written' AND output_file IS NOT NULL")
+        return [row['output_file'] for row in rows if os.path.exists(row['output_file'])]
+
+    def mark_uploaded(self, output_files: Iterable[str]) -> None:
+        output_files = [str(output_file) for output_file in output_files]
+        if not output_files:
+            return
+        with self.lock:
+            self.db.execute(
+                "UPDATE attachments SET state = 'uploaded', updated_at = ? WHERE state = 'written' AND output_file IN ({})".format(', '.join(['?'] * len(output_files))),
+                [time.time(), *output_files],
+            )
+
+    def unflagged_messages(self) -> List[Dict[str, Any]]:
+        """
+        全部附件已完成、尚未标记已读的邮件: [{'source', 'folder', 'mailbox', 'uid'}, ...]
+        """
+
+        return self._rows(
+            'SELECT source, folder, mailbox, uid FROM attachments GROUP BY mailbox, uid '
+            'HAVING SUM(flagged) = 0 AND SUM(state NOT IN (?, ?)) = 0',
+            DONE_STATES,
+        )
+
+    def mark_flagged(self, mailbox: str, uids: Iterable[str]) -> None:
+        uids = list(uids)
+        if not uids:
+            return
+        with self.lock:
+            self.db.execute(
+                'UPDATE attachments SET flagged = 1, updated_at = ? WHERE mailbox = ? AND uid IN ({})'.format(', '.join(['?'] * len(uids))),
+                [time.time(), mailbox, *uids],
+            )
+
+
+_ledgers: Dict[str, Ledger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def open_ledger(config: dict) -> Optional[Ledger]:
+    """
+    按 ledger 配置打开处理记录，同一进程内同一文件共用一个实例；未启用时返回 None
+    """
+
+    ledger_config = dict(config.get('ledger', {}) or {})
+    if not ledger_config.get('enabled', False):
+        return None
+    path = os.path.abspath(ledger_config.get('path', './data/ledger.sqlite3'))
+    with _ledgers_lock:
+        if path not in _ledgers:
+            logger.debug('打开处理记录: {}', path)
+            _ledgers[path] = Ledger(path)
+        return _ledgers[path]
@@ -1,20 +1,52 @@
 from loguru import logger as raw_logger
+import sys
 import uuid
 
 logger = raw_logger
 
-def log_init(config: dict):
-    global logger
+# 默认只有 loguru 自带的 stderr(DEBUG) 输出
+_min_level_no = raw_logger.level('DEBUG').no
+
+
+def is_enabled(level: str) -> bool:
+    """
+    是否有输出会接收该级别的日志；热点路径（逐行、逐字符的循环）先判断再构造日志参数
+    """
+
+    return raw_logger.level(level).no >= _min_level_no
+
+
+def log_init(config: dict, enqueue: bool | None = None):
+    """
+    按 log 配置输出日志；enqueue 不为 None 时覆盖配置 log.enqueue
+    """
+
+    global logger, _min_level_no
     log_config = dict(config.get('log', {}))
     try:
         if not log_config:
             return
-        
+
         log_level = 'INFO'
         if 'level' in log_config:
             log_level = str(log_config.get('level')).upper()
-        
-        raw_logger.add(log_config['output'], level=log_level, format='')
+        console_level = str(log_config.get('console_level', log_level)).upper()
+
+        # 文件输出默认由后台线程写入（enqueue），解析进程的日志也经队列汇总到主进程
+        sink_options = {
+            'level': log_level,
+            'enqueue': bool(log_config.get('enqueue', True)) if enqueue is None else enqueue,
+        }
+        if 'format' in log_config:
+            sink_options['format'] = log_config['format']
+        for option in ['rotation', 'retention', 'compression', 'buffering']:
+            if log_config.get(option) is not None:
+                sink_options[option] = log_config[option]
+
+        raw_logger.remove()
+        raw_logger.add(sys.stderr, level=console_level)
+        raw_logger.add(log_config['output'], **sink_options)
+        _min_level_no = min(raw_logger.level(log_level).no, raw_logger.level(console_level).no)
         logger = raw_logger.bind(uuid=str(uuid.uuid4()))
     finally:
         pass
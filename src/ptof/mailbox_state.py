@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ptof.logger import logger
+
+
+class MailboxState(object):
+    """
+    每个邮箱目录已处理的最大 UID 及 UIDVALIDITY（SQLite），之后只搜索 UID n+1:*，不依赖已读标记
+    UIDVALIDITY 变化时（目录被重建，UID 重新编号）从头开始
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS mailboxes (mailbox TEXT PRIMARY KEY, uidvalidity TEXT, last_uid INTEGER NOT NULL, updated_at REAL NOT NULL)')
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+    def last_uid(self, mailbox: str, uidvalidity: Optional[str]) -> int:
+        """
+        目录已处理的最大 UID；没有记录或 UIDVALIDITY 已变化时返回 0
+        """
+
+        with self.lock:
+            row = self.db.execute('SELECT uidvalidity, last_uid FROM mailboxes WHERE mailbox = ?', [mailbox]).fetchone()
+        if row is None:
+            return 0
+        if uidvalidity is None or row[0] != uidvalidity:
+            logger.warning('{} 的 UIDVALIDITY 已变化（{} => {}），重新搜索全部邮件', mailbox, row[0], uidvalidity)
+            return 0
+        return int(row[1])
+
+    def advance(self, mailbox: str, uidvalidity: Optional[str], uid: int) -> None:
+        """
+        记录已处理的最大 UID，同一 UIDVALIDITY 下只增不减
+        """
+
+        if uidvalidity is None:
+            return
+        with self.lock:
+            self.db.execute(
+                'INSERT INTO mailboxes (mailbox, uidvalidity, last_uid, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(mailbox) DO UPDATE SET '
+                'last_uid = CASE WHEN uidvalidity = excluded.uidvalidity THEN MAX(last_uid, excluded.last_uid) ELSE excluded.last_uid END, '
+                'uidvalidity = excluded.uidvalidity, updated_at = excluded.updated_at',
+                [mailbox, uidvalidity, int(uid), time.time()],
+            )
+
+
+class UidWatermark(object):
+    """
+    一个目录本次要处理的 UID 按范围拆分给多个连接时，只记录从头开始连续处理完成的最大 UID，
+    中断或某一批获取失败时，之后的邮件下次重新搜索（已处理的附件由 ledger 跳过）
+    """
+
+    def __init__(self, state: MailboxState, mailbox: str, uidvalidity: Optional[str], ranges: List[List[bytes | str]]) -> None:
+        self.state = state
+        self.mailbox = mailbox
+        self.uidvalidity = uidvalidity
+        self.ranges = [[uid.decode() if isinstance(uid, bytes) else str(uid) for uid in uid_range] for uid_range in ranges]
+        self.done_counts = [0] * len(ranges)
+        self.stalled = [False] * len(ranges)
+        self.lock = threading.Lock()
+
+    def done(self, range_idx: int, uid_batch: List[str]) -> None:
+        """
+        range_idx 范围中的一批邮件已交给下游处理
+        """
+
+        with self.lock:
+            uid_range = self.ranges[range_idx]
+            count = self.done_counts[range_idx]
+            if self.stalled[range_idx] or uid_range[count:count + len(uid_batch)] != list(uid_batch):
+                # 中间有一批未处理（如获取失败），该范围之后的进度不再记录
+                self.stalled[range_idx] = True
+                return
+            self.done_counts[range_idx] = count + len(uid_batch)
+            mark = 0
+            for uid_range, count in zip(self.ranges, self.done_counts):
+                if count:
+                    mark = int(uid_range[count - 1])
+                if count < len(uid_range):
+                    break
+        if mark:
+            self.state.advance(self.mailbox, self.uidvalidity, mark)
+
+
+_states: Dict[str, MailboxState] = {}
+_states_lock = threading.Lock()
+
+
+def open_mailbox_state(config: dict) -> MailboxState:
+    """
+    按 imap.state_path 打开目录 UID 记录，同一进程内同一文件共用一个实例
+    """
+
+    path = os.path.abspath((config.get('imap', {}) or {}).get('state_path') or './data/imap_state.sqlite3')
+    with _states_lock:
+        if path not in _states:
+            _states[path] = MailboxState(path)
+        return _states[path]
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from ptof.logger import logger
+
+
+# 各阶段累计的数值指标
+VALUE_NAMES = ['count', 'seconds', 'bytes', 'pages', 'rows']
+
+# 报告中保留的最近文件记录数，--watch / serve 长期运行时内存不随处理的文件数增长
+MAX_FILES = 1000
+
+
+class Metrics(object):
+    """
+    进程内的阶段耗时与吞吐统计：imap_fetch, download_attachments, parse, excel_write, ftp_upload ...
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.stages: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, float]] = {}
+        self.files: Deque[Dict[str, Any]] = deque(maxlen=MAX_FILES)
+        self._lock = threading.Lock()  # FTP 上传等阶段在多个线程中记录
+
+    def add(self, stage: str, labels: Optional[Dict[str, str]] = None, **values: float) -> None:
+        key = (stage, tuple(sorted((labels or {}).items())))
+        values.setdefault('count', 1)
+        with self._lock:
+            record = self.stages.setdefault(key, { name: 0 for name in VALUE_NAMES })
+            for name, value in values.items():
+                record[name] = record.get(name, 0) + (value or 0)
+
+    @contextmanager
+    def timer(self, stage: str, labels: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, float]]:
+        """
+        统计代码块耗时，可在块内向返回的字典写入 bytes/pages/rows/count
+        """
+
+        values: Dict[str, float] = {}
+        start = time.perf_counter()
+        try:
+            yield values
+        finally:
+            values['seconds'] = values.get('seconds', 0) + time.perf_counter() - start
+            self.add(stage, labels, **values)
+
+    def add_file(self, **info: Any) -> None:
+        with self._lock:
+            self.files.append(info)
+
+    def snapshot(self) -> Tuple[Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, float]], List[Dict[str, Any]]]:
+        """
+        当前统计的副本；其它线程（归档、来源获取、FTP 上传等）可能同时记录，需在锁内复制后再遍历
+        """
+
+        with self._lock:
+            return { key: dict(values) for key, values in self.stages.items() }, list(self.files)
+
+    def report(self) -> Dict[str, Any]:
+        stages_snapshot, files = self.snapshot()
+        stages = []
+        for (stage, labels), values in stages_snapshot.items():
+            stages.append({'stage': stage, 'labels': dict(labels), **values})
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+            'duration': time.time() - self.started_at,
+            'stages': stages,
+            'files': files,
+        }
+
+    def prometheus(self) -> str:
+        stages, _ = self.snapshot()
+        lines = []
+        for name in VALUE_NAMES:
+            metric = f'ptof_stage_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for (stage, labels), values in stages.items():
+                label_text = ','.join([f'stage="{stage}"'] + [ '{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels ])
+                lines.append(f'{metric}{{{label_text}}} {values.get(name, 0)}')
+        lines.append('# TYPE ptof_run_started_timestamp_seconds gauge')
+        lines.append(f'ptof_run_started_timestamp_seconds {self.started_at}')
+        lines.append('# TYPE ptof_run_last_write_timestamp_seconds gauge')
+        lines.append(f'ptof_run_last_write_timestamp_seconds {time.time()}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, config: dict) -> None:
+        """
+        按 metrics.json_output / metrics.prometheus_output 输出统计结果
+        """
+
+        metrics_config = dict(config.get('metrics', {}) or {})
+        if metrics_config.get('json_output'):
+            _atomic_write(metrics_config['json_output'], json.dumps(self.report(), ensure_ascii=False, indent=2, default=str))
+        if metrics_config.get('prometheus_output'):
+            # textfile collector 要求原子替换，避免读到半个文件
+            _atomic_write(metrics_config['prometheus_output'], self.prometheus())
+        for stage in self.report()['stages']:
+            logger.debug('阶段统计: {}', stage)
+
+
+def _atomic_write(output_file: str, content: str) -> None:
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+
+@contextmanager
+def profile(output_file: Optional[str]) -> Iterator[None]:
+    """
+    output_file 不为空时用 cProfile 统计代码块，结果保存为 pstats 文件并输出耗时最多的函数
+    """
+
+    if not output_file:
+        yield
+        return
+
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_file)
+        logger.info('性能分析结果已保存到 {}', output_file)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+
+
+metrics = Metrics()
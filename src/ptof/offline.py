@@ -0,0 +1,279 @@
+import mmap
+import os
+from collections import deque
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ptof import imap
+from ptof.logger import logger
+from ptof.metrics import metrics
+
+
+# 离线导入 mbox 文件或 Maildir 目录中的邮件，不经过 IMAP 服务器：
+# - 主进程只用 mmap 查找 mbox 中每封邮件的起止位置（或列出 Maildir 中的文件），不解析邮件
+# - 邮件引用 (文件, 邮件编号, 偏移, 长度) 按批交给进程池，子进程各自 mmap 文件，
+#   先只解析邮件头按主题过滤，再解析匹配的邮件并解码 PDF 附件
+# - 返回的附件部分与 imap.iter_pdf_part_batches 格式相同，之后经 tools.iter_attachments 进入同一流水线
+
+MAILDIR_SUBDIRS = ('cur', 'new')
+
+# 邮件引用: (文件路径, 邮件编号, 偏移, 长度)，Maildir 的长度为 None 表示整个文件
+MessageRef = Tuple[str, str, int, Optional[int]]
+
+
+def offline_config(config: dict) -> Dict[str, Any]:
+    offline = dict(config.get('offline', {}) or {})
+    return {
+        'workers': int(offline.get('workers', 0) or 0) or os.cpu_count() or 1,
+        'batch_size': max(1, int(offline.get('batch_size', 200) or 200)),
+        'subject_filter': offline.get('subject_filter', True),
+    }
+
+
+def is_maildir(path: str) -> bool:
+    return os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new'))
+
+
+def archive_mailbox(path: str) -> str:
+    """
+    ledger 中的邮箱名: mbox:<文件> 或 maildir:<目录>
+    """
+
+    return '{}:{}'.format('maildir' if os.path.isdir(path) else 'mbox', os.path.abspath(path))
+
+
+def mbox_messages(path: str) -> Iterator[MessageRef]:
+    """
+    用 mmap 按行首的 "From " 分隔 mbox 文件，邮件编号为起始偏移（文件只追加时不变）
+    """
+
+    path = os.path.abspath(path)
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        start = 0 if mm[:5] == b'From ' else mm.find(b'\nFrom ')
+        if start < 0:
+            logger.warning('{} 不是 mbox 文件，跳过', path)
+            return
+        if start:
+            start += 1
+        while start < size:
+            end = mm.find(b'\nFrom ', start)
+            end = size if end < 0 else end + 1
+            yield path, str(start), start, end - start
+            start = end
+
+
+def maildir_messages(root: str) -> Iterator[MessageRef]:
+    """
+    Maildir 及其子目录（.Folder 形式）下 cur、new 中的邮件文件，邮件编号为文件名中 ":" 之前的唯一名（标记变化时不变）
+    """
+
+    root = os.path.abspath(root)
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        for subdir in MAILDIR_SUBDIRS:
+            try:
+                with os.scandir(os.path.join(folder, subdir)) as entries:
+                    for entry in sorted(entries, key=lambda entry: entry.name):
+                        if entry.is_file() and not entry.name.startswith('.'):
+                            name = os.path.relpath(os.path.join(folder, entry.name.split(':')[0]), root)
+                            yield entry.path, name, 0, None
+            except FileNotFoundError:
+                continue
+        with os.scandir(folder) as entries:
+            stack.extend(sorted((entry.path for entry in entries if entry.is_dir() and entry.name.startswith('.')), reverse=True))
+
+
+def archive_messages(paths: Iterable[str]) -> Iterator[Tuple[str, MessageRef]]:
+    """
+    依次列出每个 mbox 文件或 Maildir 目录中的邮件 (邮箱名, 邮件引用)
+    """
+
+    for path in paths:
+        path = str(path)
+        mailbox = archive_mailbox(path)
+        if os.path.isdir(path):
+            if not is_maildir(path):
+                logger.warning('{} 不是 Maildir 目录（没有 cur/new），跳过', path)
+                continue
+            messages = maildir_messages(path)
+        else:
+            messages = mbox_messages(path)
+        for ref in messages:
+            yield mailbox, ref
+
+
+def walk_message(message, prefix: str = '') -> Iterator[Tuple[str, Any]]:
+    """
+    按 IMAP 的 part 编号规则遍历叶子部分 (编号, 部分)
+    """
+
+    if message.get_content_maintype() == 'multipart' and message.is_multipart():
+        for num, child in enumerate(message.get_payload(), 1):
+            yield from walk_message(child, f'{prefix}.{num}' if prefix else str(num))
+    else:
+        yield prefix or '1', message
+
+
+def message_parts(raw: bytes, file_ext: str) -> List[Dict[str, Any]]:
+    """
+    解析邮件，挑选规则与 imap.select_parts 相同；附件内容已解码，encoding 为 binary
+    """
+
+    config_file_ext = file_ext.split('.')[-1].lower()
+    parts = []
+    for part_no, part in walk_message(BytesParser().parsebytes(raw)):
+        filename = part.get_filename()
+        if filename:
+            filename = str(make_header(decode_header(filename)))
+            if filename.split('.')[-1].lower() != config_file_ext:
+                continue
+        elif part.get_content_type() != 'application/pdf':
+            continue
+        payload = part.get_payload(decode=False)
+        if not isinstance(payload, str):
+            continue
+        encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+        data = imap.decode_payload(payload.encode('ascii', 'surrogateescape'), encoding)
+        parts.append({
+            'part': part_no,
+            'content_type': part.get_content_type(),
+            'encoding': 'binary',
+            'size': len(data),
+            'filename': filename,
+            'payload': data,
+        })
+    return parts
+
+
+def header_end(buffer, start: int, end: int) -> int:
+    # 邮件头以空行结束，找不到时整封邮件都是邮件头
+    positions = [pos for pos in (buffer.find(b'\n\n', start, end), buffer.find(b'\n\r\n', start, end)) if pos >= 0]
+    return min(positions) + 1 if positions else end
+
+
+def decode_messages(refs: List[Tuple[str, MessageRef]], file_ext: str, subjects: List[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    在子进程中读取一批邮件：主题包含 subjects 之一（不区分大小写，为空则不过滤）的邮件才完整解析
+    返回 (读取的字节数, PDF 部分列表)
+    """
+
+    subjects = [subject.lower() for subject in subjects]
+    header_parser = BytesParser()
+    parts: List[Dict[str, Any]] = []
+    total_bytes = 0
+    opened: Dict[str, Any] = {}
+    try:
+        for mailbox, (path, uid, offset, length) in refs:
+            if length is None:
+                with open(path, 'rb') as f:
+                    buffer = f.read()
+                length = len(buffer)
+            else:
+                if path not in opened:
+                    with open(path, 'rb') as f:
+                        opened[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                buffer = opened[path]
+            start, end = offset, offset + length
+            total_bytes += length
+            if buffer[start:start + 5] == b'From ':
+                start = buffer.find(b'\n', start, end) + 1 or end  # mbox 的分隔行
+            body_start = header_end(buffer, start, end)
+            header = header_parser.parsebytes(buffer[start:body_start], headersonly=True)
+            subject = str(make_header(decode_header(header.get('Subject', '') or '')))
+            if subjects and not any(prefix in subject.lower() for prefix in subjects):
+                continue
+            try:
+                message_pdf_parts = message_parts(buffer[start:end], file_ext)
+            except Exception as e:
+                logger.warning('解析邮件失败: {} {}, {}', mailbox, uid, e)
+                continue
+            for part in message_pdf_parts:
+                parts.append({**part, 'uid': uid, 'mailbox': mailbox, 'header': header})
+    finally:
+        for buffer in opened.values():
+            buffer.close()
+    return total_bytes, parts
+
+
+def iter_archive_parts(config: dict, paths: Iterable[str], executor=None, force: bool = False) -> Iterator[dict]:
+    """
+    离线读取 mbox 文件或 Maildir 目录中的 PDF 附件部分，格式与 sources.iter_mailbox_parts 相同，交给 tools.iter_attachments
+    - offline.subject_filter 为 true 时只解析主题包含 [解析器名] 的邮件
+    - 启用 ledger 时已处理的附件（含在 IMAP 中处理过的同一 Message-ID）跳过，force 为 true 时重新处理
+    - 传入 executor 时使用该进程池解码，否则按 offline.workers 临时创建；同时进行中的批次不超过进程数的 2 倍
+    """
+
+    from ptof import sources
+    from ptof.ledger import open_ledger
+
+    settings = offline_config(config)
+    subjects = sources.parser_subjects(config) if settings['subject_filter'] else []
+    file_ext = config['attachments']['file_ext']
+    ledger = open_ledger(config)
+
+    def batches() -> Iterator[List[Tuple[str, MessageRef]]]:
+        batch: List[Tuple[str, MessageRef]] = []
+        for item in archive_messages(paths):
+            batch.append(item)
+            if len(batch) >= settings['batch_size']:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    own_executor = None
+    if executor is None and settings['workers'] > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = own_executor = ProcessPoolExecutor(max_workers=settings['workers'])
+    try:
+        if executor is None:
+            results: Iterator = ((len(batch), decode_messages(batch, file_ext, subjects)) for batch in batches())
+        else:
+            results = _ordered_results(executor, batches(), file_ext, subjects, settings['workers'] * 2)
+
+        count = 0
+        for messages, (total_bytes, parts) in results:
+            metrics.add('archive_read', bytes=total_bytes, count=messages)
+            count += messages
+            if ledger is not None:
+                if not force:
+                    parts = [part for part in parts if not ledger.skip_part(part['mailbox'], part['uid'], part['part'], part['header'].get('Message-ID'))]
+                for part in parts:
+                    part['ledger_key'] = ledger.key(part['mailbox'], part['uid'], part['part'])
+                # 离线邮件没有已读标记，flagged 记为 1，不参与 flag_done_messages
+                ledger.record_many([(part['ledger_key'], 'fetched', {
+                    'source': 'offline',
+                    'folder': part['mailbox'].split(':', 1)[1],
+                    'mailbox': part['mailbox'],
+                    'uid': part['uid'],
+                    'part': part['part'],
+                    'message_id': part['header'].get('Message-ID'),
+                    'flagged': 1,
+                }) for part in parts])
+            yield from parts
+        logger.info('离线邮件读取完成, 共 {} 封', count)
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _ordered_results(executor, batches: Iterator[List[Tuple[str, MessageRef]]], file_ext: str, subjects: List[str], window: int) -> Iterator[Tuple[int, Tuple[int, List[Dict[str, Any]]]]]:
+    # 按提交顺序返回 (邮件数, 结果)，最多 window 个批次同时进行，下游变慢时不再提交，内存占用有上限
+    pending: deque = deque()
+    try:
+        for batch in batches:
+            pending.append((len(batch), executor.submit(decode_messages, batch, file_ext, subjects)))
+            if len(pending) >= window:
+                messages, future = pending.popleft()
+                yield messages, future.result()
+        while pending:
+            messages, future = pending.popleft()
+            yield messages, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
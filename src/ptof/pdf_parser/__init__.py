@@ -1,15 +1,55 @@
+import importlib
+from functools import lru_cache
+from typing import Dict
+
 from ptof.logger import logger
-from .parser import ParserBase, Optional
+from .parser import ParserBase, PdfSource, Optional
+from .result import ColumnarResult, as_columnar
+from .spec import load_parser_specs
+from . import pages
+
+# 内置解析器：名称 => 模块，首次使用时才导入
 # from ptof.smic import SMICParser as _
 # from ptof.xmc import XMCParser as _
-from .package_list import PackageListParser as _
+BUILTIN_PARSERS = {
+    'PackageList': 'ptof.pdf_parser.package_list',
+}
+
+# 第三方解析器通过 entry point 注册，名称需与解析器的 name 一致，例如 setup.py 中:
+#   entry_points={'ptof.parsers': ['SMIC = your_package.smic:SMICParser']}
+ENTRY_POINT_GROUP = 'ptof.parsers'
+
+
+@lru_cache(maxsize=None)
+def parser_index() -> Dict[str, str]:
+    """
+    解析器名称 => 模块，只读取 entry point 元数据，不导入解析器模块；每个进程只扫描一次
+    """
+
+    from importlib.metadata import entry_points
+    index = dict(BUILTIN_PARSERS)
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        index.setdefault(entry_point.name, entry_point.module)
+    return index
+
+
+def parser_names() -> list:
+    return list(dict.fromkeys([*ParserBase.plugins.keys(), *parser_index().keys()]))
+
 
 def create_parser(name: str, *args, **kwargs) -> Optional[ParserBase]:
+    if name not in ParserBase.plugins.keys() and name in parser_index():
+        try:
+            importlib.import_module(parser_index()[name])  # 导入时由 ParserBase.__init_subclass__ 注册
+        except ImportError as e:
+            logger.error("Parser Import Error, name: {}, module: {}, error: {}", name, parser_index()[name], e)
+            return None
+
     if name not in ParserBase.plugins.keys():
-        logger.error("Parser Not Found, name: {}, names: {}", name, ParserBase.plugins.keys())
+        logger.error("Parser Not Found, name: {}, names: {}", name, parser_names())
         return None
-    
+
     return ParserBase.plugins[name](*args, **kwargs)
 
 
-__import__ = ["create_parser"]
+__import__ = ["create_parser", "load_parser_specs", "parser_names"]
@@ -0,0 +1,149 @@
+import re
+from re import _parser as sre_parse
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 正则开头的全局标记，如 (?i)，合并后不再位于开头，需改为 (?i:...) 的局部形式
+GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+
+
+def split_global_flags(pattern: str) -> Tuple[str, str]:
+    """
+    拆分正则开头的全局标记，返回 (标记, 其余部分)
+    """
+
+    flags = ''
+    while match := GLOBAL_FLAGS.match(pattern):
+        flags += match.group(1)
+        pattern = pattern[match.end():]
+    return flags, pattern
+
+
+def has_group_references(pattern: re.Pattern) -> bool:
+    """
+    正则是否引用分组（\\1 或 (?(1)...)），合并后分组序号改变，这类正则需单独查找
+    """
+
+    def walk(items) -> bool:
+        for op, av in items:
+            if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+                return True
+            for value in (av if isinstance(av, (tuple, list)) else [av]):
+                if isinstance(value, sre_parse.SubPattern) and walk(value):
+                    return True
+        return False
+
+    return walk(sre_parse.parse(pattern.pattern, pattern.flags))
+
+
+class FieldScanner(object):
+    """
+    声明式字段提取：所有字段的正则合并为一个扫描器，一次遍历文本填充全部字段
+
+    字段声明示例（Python dict 或 YAML）::
+
+        Date:
+          pattern: 'DATE\\s+(\\d{4}-\\d{2}-\\d{2})'
+          group: 1          # 取值的分组，默认 1（正则没有分组时为 0）
+          flags: 'i'        # 可选: i m s x
+        Wafer_ID:
+          pattern: 'Wafer ID:\\s*#?\\s*((?:\\d+,)*\\d+)'
+          split: ','        # 按分隔符拆分为列表
+        DF_Code:
+          value: 'DF_SH'    # 固定值
+    """
+
+    version = '2'  # 提取规则变化时递增，YAML 声明的解析器的缓存随之失效; 2: 引用分组的正则单独查找，开头的全局标记改为局部
+
+    def __init__(self, fields: Dict[str, Dict[str, Any]]) -> None:
+        self.fields = { name: dict(spec or {}) for name, spec in fields.items() }
+        self.patterns: Dict[str, re.Pattern] = {}
+        self.value_groups: Dict[str, int] = {}  # 取值分组在字段自身正则中的序号
+        self.scan_groups: Dict[str, int] = {}  # 取值分组在合并正则中的序号
+        self.outer_names: Dict[str, str] = {}
+        self.separate: List[str] = []  # 引用分组、不能合并的字段，单独查找
+        alternatives = []
+        offset = 1
+        for idx, (name, spec) in enumerate(self.fields.items()):
+            if 'pattern' not in spec:
+                continue
+            global_flags, body = split_global_flags(str(spec['pattern']))
+            inline_flags = ''.join(dict.fromkeys(global_flags + ''.join(flag for flag in str(spec.get('flags', '')).lower() if flag in 'imsx')))
+            if 'x' in inline_flags:
+                body += '\n'  # 结尾的 # 注释不能吞掉局部标记的右括号
+            try:
+                pattern = re.compile(f'(?{inline_flags}:{body})' if inline_flags else body)
+            except re.error as e:
+                raise ValueError(f'字段 {name} 的正则有误: {e}') from e
+            if pattern.groupindex:
+                raise ValueError(f'字段 {name} 的正则不能使用命名分组')
+            self.patterns[name] = pattern
+            self.value_groups[name] = int(spec.get('group', 1 if pattern.groups else 0))
+            if self.value_groups[name] > pattern.groups:
+                raise ValueError(f'字段 {name} 的取值分组 {self.value_groups[name]} 不存在')
+            if has_group_references(pattern):
+                self.separate.append(name)
+                continue
+            outer_name = f'_f{idx}'
+            self.outer_names[outer_name] = name
+            self.scan_groups[name] = offset + self.value_groups[name]
+            alternatives.append(f'(?P<{outer_name}>{pattern.pattern})')
+            offset += 1 + pattern.groups
+        self.scanner = re.compile('|'.join(alternatives)) if alternatives else None
+
+    def _value(self, name: str, raw: Optional[str]) -> Any:
+        spec = self.fields[name]
+        if raw is None:
+            return spec.get('default')
+        value = raw.strip()
+        if 'split' in spec:
+            return [item.strip() for item in value.split(spec['split'])]
+        return value
+
+    def scan(self, text: str) -> Dict[str, Any]:
+        """
+        返回 {字段名: 值}，未匹配的字段为 default（默认 None）
+        """
+
+        values: Dict[str, Any] = {}
+        for name, spec in self.fields.items():
+            if 'pattern' not in spec:
+                values[name] = spec.get('value', spec.get('default'))
+
+        pending = set(self.scan_groups.keys())
+        spans: List[Tuple[int, int]] = []  # 已遍历的匹配范围，其它字段在这些范围内开始的匹配被跳过
+        if self.scanner is not None:
+            for match in self.scanner.finditer(text):
+                name = self.outer_names[match.lastgroup]
+                if name in pending:
+                    shadowed = self._shadowed_match(name, text, spans)
+                    if shadowed is not None:
+                        values[name] = self._value(name, shadowed.group(self.value_groups[name]))
+                    else:
+                        values[name] = self._value(name, match.group(self.scan_groups[name]))
+                    pending.discard(name)
+                    if not pending:
+                        break
+                spans.append(match.span())
+
+        # 每次匹配都被其它字段覆盖而未命中的字段，以及不能合并的字段，单独查找一次
+        for name in [*pending, *self.separate]:
+            match = self.patterns[name].search(text)
+            values[name] = self._value(name, match.group(self.value_groups[name]) if match else None)
+        return values
+
+    def _shadowed_match(self, name: str, text: str, spans: List[Tuple[int, int]]) -> Optional[re.Match]:
+        """
+        字段在之前的匹配范围内开始的第一个匹配（合并扫描时被重叠的匹配跳过），没有时返回 None
+        """
+
+        pattern = self.patterns[name]
+        for start, end in spans:
+            for pos in range(start, max(end, start + 1)):
+                match = pattern.match(text, pos)
+                if match is not None:
+                    return match
+        return None
+
+    def field_names(self) -> List[str]:
+        return list(self.fields.keys())
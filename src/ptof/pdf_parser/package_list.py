@@ -1,33 +1,56 @@
 from pathlib import Path
-from .parser import ParserBase, Optional, List, Dict, Tuple, fitz
-from ptof.logger import logger
+import fitz
+from .parser import ParserBase, PdfSource, ColumnarResult, Optional, List, Dict, Tuple
+from .table import word_table
+from ptof.logger import logger, is_enabled
 import re
 
 class PackageListParser(ParserBase):
     name = 'PackageList'
+    version = '3'  # 2: 表格引擎默认改回 text，使 words 引擎产生的缓存失效; 3: 修正与其它字段重叠时取到后面匹配的字段值
+    table_engine = 'text'  # text: 按定宽字符串切分（get_table + format_table，较快）; words: 按单词坐标分列（每页多一次 get_text('words')）
+    fields = {
+        'Date': {'pattern': r'DATE\s+(\d{4}-\d{2}-\d{2})'},
+        'PO_No': {'pattern': r'CTM ORDER NO\.\s*(\S+)'},
+        'Good_Qty': {'pattern': r'TOTAL QUANTITY\s*(\d+)\s*PC'},
+        'Wafer_ID': {'pattern': r'Wafer ID:\s*#?\s*((?:\d+,)*\d+)', 'split': ','},
+        'DF_Code': {'value': 'DF_SH'},  # 固定值
+        'Device_Code': {'value': 'SDC100.01.02'},  # 固定值
+    }
+    # 表头字段和 Item 表都在前几页，找齐后跳过后面的附录页
+    required_patterns = {
+        'table': re.compile(r'^([\S]+\s*)?Item', re.M),
+        **{ name: re.compile(spec['pattern']) for name, spec in fields.items() if 'pattern' in spec },
+    }
 
-    def do(self, pdf_file: str | Path, *args, **kwargs) -> Optional[List[Dict]]:
+    def do(self, pdf_file: PdfSource, *args, **kwargs) -> Optional[ColumnarResult]:
         table_sniff_str = re.compile('^([\S]+\s*)?Item')  # type: ignore # 表格标识字符串
         if not table_sniff_str:
             logger.error('未提供表格标识字符串，请检查配置')
             return None
-        with fitz.open(pdf_file) as pdf:  # 使用 PyMuPDF 打开 PDF 文件
+        with self.open_pdf(pdf_file) as pdf:  # 使用 PyMuPDF 打开 PDF 文件（路径或内存中的内容）
             flags = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_SPANS
-            page_text = '\n'.join([page.get_text('text', sort=True, flags=flags) for page in pdf.pages()])  # 提取第一页的文本内容
-            logger.debug('PDF内容: \n{}', page_text)
-            (po_table, line_offset) = self.get_table(page_text, table_sniff_str, line_offset=0)
-            po = self.format_table(po_table)  # 格式化表格信息
+            page_words = [] if self.table_engine == 'words' else None
+            page_text = self.extract_text(pdf, flags, page_words)  # 逐页提取文本，所需内容找齐后提前结束
+            logger.trace('PDF内容: \n{}', page_text)
+            if page_words is not None:
+                po = word_table(page_words, table_sniff_str)  # 按单词坐标提取表格
+            else:
+                (po_table, line_offset) = self.get_table(page_text, table_sniff_str, line_offset=0)
+                po = self.format_table(po_table)  # 格式化表格信息
             # (box_table, line_offset) = self.get_table(page_text, 'Box ID', line_offset=line_offset)
             # box = self.format_table(box_table)  # 格式化表格信息
-            po_no = self.get_po_no(page_text)
+            values = self.scan_fields(page_text)  # 一次遍历提取全部字段
+            logger.debug('提取到的字段: {}', values)
+            po_no = values['PO_No']
             lot_no = po['rows'][0][2].split('/')[0].strip() if po['rows'] else ''  # 取第一行的Lot No
-            wafer_ids = self.get_wafer_id(page_text)
+            wafer_ids = values['Wafer_ID']
             extracted_data = {
-                'Date': self.get_date(page_text),
+                'Date': values['Date'],
                 'Cust._Code': '', # N/A
-                'DF_Code': self.get_df_code(page_text),
+                'DF_Code': values['DF_Code'],
                 'PO_No': po_no,
-                'Device_Code': self.get_device_code(page_text),
+                'Device_Code': values['Device_Code'],
                 'Device': po['rows'][0][1].split('/')[1].strip() if po['rows'] else '', #  Customer Device ID
                 'OSAT_Device': po['rows'][0][1].split('/')[0].strip() if po['rows'] else '',  # Material
                 'OSAT.Lot_no': lot_no,
@@ -35,20 +58,20 @@ class PackageListParser(ParserBase):
                 'Lot_Type': po_no[4] if po_no else '',  # 如果没有PO No 第 5 字符则为 N/A
                 'Manufacturing_Mode': '', # N/A
                 'BIN': '', # N/A
-                'Good_Qty': self.get_good_qty(page_text),
+                'Good_Qty': values['Good_Qty'],
                 'Reject_Qty': '', # N/A
                 'Datecode': '', # N/A
             }
             logger.debug('提取到的数据: {}', extracted_data)
-            parse_results = []
+            wafer_ids = [ wafer_id.strip() for wafer_id in wafer_ids or [] ]  # 去掉前后的空格
+            if not wafer_ids:
+                return None
+            # 每个 Wafer 一行，除 Wafer ID 外的字段所有行相同，按列保存，不为每一行复制 dict
+            extracted_data['Wafer_ID'] = wafer_ids
             fields = self.field_names()
-            for wafer_id in wafer_ids or []:
-                tmp = extracted_data.copy()  # 复制提取到的数据
-                tmp['Wafer_ID'] = wafer_id.strip()  # 去掉前后的空格
-                data = { v: tmp[k] for k, v in fields.items() }
-                parse_results.append(data)
-            logger.debug('数据规整后: {}', parse_results)
-            return parse_results if parse_results else None
+            parse_results = ColumnarResult.from_columns({ v: extracted_data[k] for k, v in fields.items() }, len(wafer_ids), varying=[fields['Wafer_ID']])
+            logger.trace('数据规整后: {}', parse_results)
+            return parse_results
 
         return None
 
@@ -56,6 +79,7 @@ class PackageListParser(ParserBase):
         """
         格式化表格信息，将表头和行数据分离
         """
+        trace = is_enabled('TRACE')  # 逐行日志只在 TRACE 级别输出，关闭时不构造参数
         formatted_table = {
             'headers': [],
             'rows': []
@@ -84,7 +108,8 @@ class PackageListParser(ParserBase):
                     pass
                 next_header = header_line_[start:end].strip()
                 start = end
-                logger.debug('处理新的表头: {}, {}, {} => {}', next_header, header_line_, offset_idx, header_keys[offset_idx])
+                if trace:
+                    logger.trace('处理新的表头: {}, {}, {} => {}', next_header, header_line_, offset_idx, header_keys[offset_idx])
                 if next_header:
                     if not re.search(end_word_regex, header_keys[offset_idx]):
                         header_keys[offset_idx] += '\t' + next_header
@@ -119,6 +144,7 @@ class PackageListParser(ParserBase):
 
     def get_table(self, page_text, table_sniff_str: str | re.Pattern, line_offset = 0) -> Tuple[Dict[str, List[str]], int]:
         page_text_lines = page_text.splitlines()
+        trace = is_enabled('TRACE')  # 逐行日志只在 TRACE 级别输出，关闭时不构造参数
         table_info = {
             'header_offsets': [],
             'headers': [],
@@ -131,9 +157,9 @@ class PackageListParser(ParserBase):
         for (line_num, line) in enumerate(page_text_lines[line_offset:]):
             if not line.strip():
                 continue
-            logger.debug('type of sniff str: {}', type(table_sniff_str))
             if isinstance(table_sniff_str, str):
-                logger.info('精准嗅探: {}', table_sniff_str)
+                if trace:
+                    logger.trace('精准嗅探: {}', table_sniff_str)
                 if line.startswith(table_sniff_str):
                     table_sniff_size = len(table_sniff_str)
                     logger.debug('找到包含 "{}" 的行: {}', table_sniff_str, line)
@@ -141,9 +167,10 @@ class PackageListParser(ParserBase):
                     line_offset = line_offset_raw + line_num  # 记录当前行号
                     continue  # 继续检查下一行
             elif isinstance(table_sniff_str, re.Pattern):
-                logger.info('模糊嗅探: {}', table_sniff_str)
+                if trace:
+                    logger.trace('模糊嗅探: {}', table_sniff_str)
                 if matched := table_sniff_str.match(line):
-                    logger.info('matched: {}', matched.groups())
+                    logger.debug('matched: {}', matched.groups())
                     table_sniff_size = len(matched[0])
                     logger.debug('找到包含 "{}" 的行: {}', table_sniff_str, line)
                     table_info['headers'].append(line)  # 添加当前行到表格行
@@ -155,7 +182,8 @@ class PackageListParser(ParserBase):
                     logger.debug('找到不以空格开头的行，结束表格提取: {}', line)
                     line_offset = line_offset_raw + line_num  # 记录当前行号
                     break
-                logger.debug('找到表格行: {}', line)
+                if trace:
+                    logger.trace('找到表格行: {}', line)
                 table_info['headers'].append(line)  # 添加当前行到表格行
                 continue # 继续检查下一行
         
@@ -170,7 +198,8 @@ class PackageListParser(ParserBase):
         empty_line_count = 0
         line_offset_raw = line_offset
         for (line_num, line) in enumerate(page_text_lines[line_offset:]):
-            logger.debug('{}表处理行: {}', table_sniff_str, line)
+            if trace:
+                logger.trace('{}表处理行: {}', table_sniff_str, line)
             if not line.strip():
                 empty_line_count += 1
                 if empty_line_count <= 1:  # 允许最多一行空行
@@ -184,7 +213,8 @@ class PackageListParser(ParserBase):
                 line_offset = line_offset_raw + line_num  # 记录当前行号
                 break
             
-            logger.debug('添加行到{}表: {}', table_sniff_str, line)
+            if trace:
+                logger.trace('添加行到{}表: {}', table_sniff_str, line)
             table_info['rows'].append(line)  # 添加当前行到表格行
 
         logger.debug('{}表行: {}', table_sniff_str, table_info['rows'])
@@ -231,49 +261,30 @@ class PackageListParser(ParserBase):
             'Datecode': 'Datecode',
         }
     
-    def get_device_code(self, _) -> Optional[str]:
-        return 'SDC100.01.02'  # 固定值
+    def get_device_code(self, page_text) -> Optional[str]:
+        return self.get_field(page_text, 'Device_Code')
     
-    def get_df_code(self, _) -> Optional[str]:
-        return 'DF_SH'  # 固定值
+    def get_df_code(self, page_text) -> Optional[str]:
+        return self.get_field(page_text, 'DF_Code')
 
     def get_good_qty(self, page_text) -> Optional[str]:
-        regex = r'TOTAL QUANTITY\s*(\d+)\s*PC'
-        if match := re.search(regex, page_text):
-            good_qty = match.group(1).strip()
-            logger.debug('提取到的Good Qty: {}', good_qty)
-            return good_qty
-        else:
-            logger.debug('未提取到Good Qty')
-            return None
+        return self.get_field(page_text, 'Good_Qty')
         
     def get_po_no(self, page_text) -> Optional[str]:
-        regex = r'CTM ORDER NO\.\s*(\S+)'
-        if match := re.search(regex, page_text):
-            po_no = match.group(1).strip()
-            logger.debug('提取到的PO No: {}', po_no)
-            return po_no.removeprefix('CTM ORDER NO.').strip()  # 去掉前面的 'CTM ORDER NO.' 字符串
-        else:
-            logger.debug('未提取到PO No')
-            return None
-
+        return self.get_field(page_text, 'PO_No')
 
     def get_date(self, page_text) -> Optional[str]:
-        regex = r'DATE\s+\d{4}-\d{2}-\d{2}'
-        if match := re.search(regex, page_text):
-            date = match.group(0).strip()
-            logger.debug('提取到的日期: {}', date)
-            return date.replace('DATE', '').strip()  # 去掉前面的 'DATE' 字符串
-        else:
-            logger.debug('未提取到日期')
-            return None
+        return self.get_field(page_text, 'Date')
     
     def get_wafer_id(self, page_text) -> Optional[List]:
-        regex = r'Wafer ID:\s*(#)?\s*(\d+,)*(\d+)\s*'
-        if match := re.search(regex, page_text):
-            wafer_id = match.group(0).strip()
-            logger.debug('提取到的Wafer ID: {}', wafer_id)
-            return wafer_id.replace('Wafer ID:', '').strip().replace('#', '').split(',')
-        else:
-            logger.debug('未提取到Wafer ID')
-            return None
\ No newline at end of file
+        return self.get_field(page_text, 'Wafer_ID')
+
+    def get_field(self, page_text, name: str):
+        """
+        单独提取一个字段；同一文本只扫描一次，之后的字段从 scan_fields 的结果中读取
+        """
+
+        value = self.scan_fields(page_text).get(name)
+        if value is None:
+            logger.debug('未提取到{}', name)
+        return value
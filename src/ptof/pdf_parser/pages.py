@@ -0,0 +1,142 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ptof.logger import logger
+
+
+# 页面级并行提取：页数超过 threshold 的文档按 chunk_pages 页一段，分给 workers 个进程，
+# 每个进程各自打开文档（PyMuPDF 的文档对象不能跨线程共享），结果按页码顺序合并
+settings: Dict[str, Any] = {
+    'threshold': 0,     # 0 表示关闭
+    'workers': 1,       # 由 configure 按解析进程数计算
+    'chunk_pages': 20,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # fork 出的解析进程继承了父进程的进程池对象（没有管理线程，不能使用）和可能已持有的锁，重新开始
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure(config: dict) -> None:
+    """
+    读取 parse_results.page_parallel 配置，主进程和每个解析进程各调用一次
+    """
+
+    parse_config = config.get('parse_results', {}) or {}
+    page_config = dict(parse_config.get('page_parallel', {}) or {})
+    settings['threshold'] = int(page_config.get('threshold', 0) or 0)
+    settings['workers'] = max_workers(int(parse_config.get('workers', 0) or 0), int(page_config.get('workers', 0) or 0))
+    settings['chunk_pages'] = max(1, int(page_config.get('chunk_pages', 20) or 20))
+
+
+def max_workers(parse_workers: int, page_workers: int = 0) -> int:
+    """
+    每个解析进程的页面提取进程数：每个解析进程各有一个进程池，合计不超过 CPU 核数
+    即 CPU 核数 // 解析进程数（至少 1）；page_parallel.workers 只能进一步调小
+    """
+
+    cpu_count = os.cpu_count() or 1
+    limit = max(1, cpu_count // max(1, parse_workers or cpu_count))
+    return min(page_workers, limit) if page_workers > 0 else limit
+
+
+def enabled(page_count: int) -> bool:
+    return bool(settings['threshold']) and page_count > settings['threshold']
+
+
+def get_executor():
+    """
+    本进程的页面提取进程池，首次使用时创建，进程退出时关闭
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import resource_tracker, util
+            # 先启动共享内存的跟踪进程，子进程沿用同一个，SharedSource 在主进程 unlink 后不会被子进程的跟踪进程重复清理
+            resource_tracker.ensure_running()
+            workers = settings['workers']
+            logger.debug('创建页面提取进程池, 进程数: {}', workers)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            # 解析进程（multiprocessing 子进程）退出时不执行 atexit，而会等待全部非 daemon 子进程结束，
+            # 不关闭进程池会一直等待页面提取进程；Finalize 在等待子进程之前执行，主进程退出时同样执行。
+            # 优先级需高于进程池内部队列的 Finalize（10），否则队列的发送线程先退出，结束信号发不到页面提取进程
+            util.Finalize(None, shutdown_executor, exitpriority=100)
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """
+    关闭本进程的页面提取进程池，之后再次使用时重新创建
+    """
+
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SharedSource(object):
+    """
+    内存中的 PDF 复制到共享内存一次，每个分段只传递 (名称, 长度)，不再为每个分段序列化整个文件
+    """
+
+    def __init__(self, data: bytes | bytearray | memoryview) -> None:
+        from multiprocessing import shared_memory
+        self.size = len(data)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.size))
+        self.shm.buf[:self.size] = data
+
+    @property
+    def handle(self) -> Tuple[str, int]:
+        return self.shm.name, self.size
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    @staticmethod
+    def read(handle: Tuple[str, int]) -> bytes:
+        from multiprocessing import shared_memory
+        name, size = handle
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return bytes(shm.buf[:size])
+        finally:
+            shm.close()
+
+
+def chunks(numbers: Sequence[int], size: int) -> List[List[int]]:
+    return [list(numbers[idx:idx + size]) for idx in range(0, len(numbers), size)]
+
+
+def extract_pages(source: Any, numbers: List[int], flags: int, clip: Optional[Tuple[float, float, float, float]], with_words: bool) -> List[Tuple[str, Optional[list]]]:
+    """
+    在子进程中打开文档，按顺序提取指定页的文本（和单词坐标），返回 [(文本, 单词), ...]
+    source 为文件路径，或 SharedSource.handle（内存中的 PDF）
+    """
+
+    from .parser import ParserBase
+    if isinstance(source, tuple):
+        source = SharedSource.read(source)
+    pages = []
+    with ParserBase.open_source(source) as pdf:
+        for number in numbers:
+            page = pdf.load_page(number)
+            text = page.get_text('text', sort=True, flags=flags, clip=clip)
+            words = page.get_text('words', sort=True, flags=flags, clip=clip) if with_words else None
+            pages.append((text, words))
+    return pages
@@ -1,19 +1,162 @@
-from typing import Optional, Type, Dict, List, Tuple
+from typing import Any, Optional, Type, Dict, List, Tuple, Iterator, TYPE_CHECKING
 from pathlib import Path
-import fitz
+import re
+from .fields import FieldScanner
+from .result import ColumnarResult
+from . import pages
+
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF 导入较慢，由具体解析器模块导入
+
+# 解析器的输入：文件路径，或内存中的 PDF 内容（邮件附件解码后直接解析，不经过磁盘）
+PdfSource = str | Path | bytes | bytearray | memoryview
 
 class ParserBase(object):
     
     name: str
+    version: str = '1'  # 解析逻辑变化时递增，使旧的解析缓存失效
     plugins: Dict[str, Type["ParserBase"]] = {}
 
+    pages: Optional[List[int]] = None  # 需要读取的页码（从 0 开始，负数表示倒数），None 表示全部
+    clip: Optional[Tuple[float, float, float, float]] = None  # 每页只提取该矩形区域 (x0, y0, x1, y1) 内的文本
+    required_patterns: Dict[str, re.Pattern] = {}  # 全部匹配后停止读取后续页面，为空时读取全部页面
+    fields: Optional[Dict[str, Dict[str, Any]]] = None  # 声明式字段，格式见 fields.FieldScanner
+
     def __init__(self, *args, **kwargs) -> None:
-        pass
+        self.stats: Dict[str, Any] = {}  # 最近一次解析的统计信息，如读取的页数
+        self.source: Optional[bytes | bytearray | memoryview] = None  # 最近一次 open_pdf 打开的内存内容
+        self._scanned: Optional[Tuple[str, Dict[str, Any]]] = None  # 最近一次 scan_fields 的 (文本, 字段)
 
     def __init_subclass__(cls, *args, **kwargs) -> None:
         super().__init_subclass__(*args, **kwargs)
         if hasattr(cls, 'name') and cls.name:
             cls.plugins[cls.name] = cls
+        if cls.__dict__.get('fields') and '_field_scanner' not in cls.__dict__:
+            cls._field_scanner = FieldScanner(cls.fields)  # 定义解析器时即校验字段声明，而不是首次解析时
     
-    def do(self, pdf_file: str | Path, *args, **kwargs) -> Optional[List[Dict]]:
+    def do(self, pdf_file: PdfSource, *args, **kwargs) -> Optional[ColumnarResult | List[Dict]]:
+        """
+        解析 PDF，返回 ColumnarResult（按列保存，推荐）或逐行的 List[Dict]，没有结果时返回 None
+        """
         return None
+
+    def open_pdf(self, pdf_file: PdfSource) -> "fitz.Document":
+        """
+        打开 PDF：路径从磁盘读取，bytes / memoryview 使用 fitz.open(stream=...) 直接在内存中打开
+        内存中的内容同时保留，页面并行提取时由子进程各自打开
+        """
+
+        self.source = pdf_file if isinstance(pdf_file, (bytes, bytearray, memoryview)) else None
+        return self.open_source(pdf_file)
+
+    @staticmethod
+    def open_source(pdf_file: PdfSource) -> "fitz.Document":
+        import fitz
+        if isinstance(pdf_file, (bytes, bytearray, memoryview)):
+            return fitz.open(stream=pdf_file, filetype='pdf')
+        return fitz.open(pdf_file)
+
+    @classmethod
+    def field_scanner(cls) -> Optional[FieldScanner]:
+        """
+        字段扫描器，每个进程中每个解析器只编译一次
+        """
+
+        scanner = cls.__dict__.get('_field_scanner')
+        if scanner is None and cls.fields:
+            scanner = FieldScanner(cls.fields)
+            cls._field_scanner = scanner
+        return scanner
+
+    def scan_fields(self, page_text: str) -> Dict[str, Any]:
+        """
+        一次遍历文本提取全部声明的字段，同一文本再次调用（如逐个字段的 get_*）时直接返回上次的结果
+        """
+
+        if self._scanned is not None and self._scanned[0] == page_text:
+            return self._scanned[1]
+        scanner = self.field_scanner()
+        values = scanner.scan(page_text) if scanner else {}
+        self._scanned = (page_text, values)
+        return values
+
+    def page_numbers(self, pdf: "fitz.Document") -> List[int]:
+        """
+        按声明需要读取的页码
+        """
+
+        page_count = pdf.page_count
+        if self.pages is None:
+            return list(range(page_count))
+        return [number % page_count for number in self.pages if -page_count <= number < page_count]
+
+    def iter_pages(self, pdf: "fitz.Document") -> Iterator["fitz.Page"]:
+        """
+        按声明的页码逐页加载
+        """
+
+        for number in self.page_numbers(pdf):
+            yield pdf.load_page(number)
+
+    def iter_page_texts(self, pdf: "fitz.Document", flags: int = 0, with_words: bool = False) -> Iterator[Tuple[str, Optional[List[Tuple]]]]:
+        """
+        按页码顺序逐页返回 (文本, 单词坐标)
+        页数超过 parse_results.page_parallel.threshold 时，第一段在当前进程读取，仍需后续页面时其余分段同时提交到
+        页面提取进程池，每个进程各自打开文档，结果仍按页码顺序返回；调用方提前结束时取消未开始的分段
+        """
+
+        numbers = self.page_numbers(pdf)
+        source = pdf.name or self.source
+        if not source or not pages.enabled(len(numbers)):
+            for page in self.iter_pages(pdf):
+                text = page.get_text('text', sort=True, flags=flags, clip=self.clip)
+                yield text, page.get_text('words', sort=True, flags=flags, clip=self.clip) if with_words else None
+            return
+
+        page_chunks = pages.chunks(numbers, pages.settings['chunk_pages'])
+        # 第一段在当前进程读取，通常已包含所需字段，此时不再提交其它分段
+        for number in page_chunks[0]:
+            page = pdf.load_page(number)
+            text = page.get_text('text', sort=True, flags=flags, clip=self.clip)
+            yield text, page.get_text('words', sort=True, flags=flags, clip=self.clip) if with_words else None
+
+        self.stats['page_parallel'] = len(page_chunks) - 1  # 提交到进程池的分段数
+        shared = None
+        if not isinstance(source, str):
+            shared = pages.SharedSource(source)  # 内存中的内容只复制一次到共享内存
+            source = shared.handle
+        executor = pages.get_executor()
+        futures = [executor.submit(pages.extract_pages, source, chunk, flags, self.clip, with_words) for chunk in page_chunks[1:]]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            if shared is not None:
+                shared.close()
+
+    def extract_text(self, pdf: "fitz.Document", flags: int = 0, words: Optional[List[List[Tuple]]] = None) -> str:
+        """
+        逐页提取文本，required_patterns 全部找到后不再读取后续页面
+        传入 words 列表时，同时按页追加单词坐标 get_text('words')
+        """
+
+        texts = []
+        pending = set(self.required_patterns.keys())
+        self.stats['page_count'] = pdf.page_count
+        self.stats['pages'] = 0
+        page_texts = self.iter_page_texts(pdf, flags, words is not None)
+        try:
+            for text, page_words in page_texts:
+                self.stats['pages'] += 1
+                texts.append(text)
+                if words is not None:
+                    words.append(page_words)
+                if pending:
+                    pending = { name for name in pending if not self.required_patterns[name].search(text) }
+                    if not pending:
+                        break
+        finally:
+            page_texts.close()
+        return '\n'.join(texts)
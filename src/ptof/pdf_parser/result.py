@@ -0,0 +1,104 @@
+from itertools import chain, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class ColumnarResult(object):
+    """
+    列式解析结果：每列保存为 (值, 重复次数) 的游程编码，不为每一行构造 dict
+    - 所有行相同的表头字段（日期、PO No 等）只保存一个值和行数
+    - 逐行不同的列（如 Wafer ID）repeats 为 None，values 即每行的值
+    写入器和解析缓存直接读取列数据；第三方解析器仍可返回 List[Dict]，由 from_rows 转换
+    """
+
+    __slots__ = ('headers', 'values', 'repeats', 'row_count')
+
+    def __init__(self, headers: Sequence[str], values: Dict[str, List[Any]], repeats: Dict[str, Optional[List[int]]], row_count: int) -> None:
+        self.headers = list(headers)
+        self.values = values
+        self.repeats = repeats
+        self.row_count = row_count
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Any], row_count: int, varying: Iterable[str] = ()) -> "ColumnarResult":
+        """
+        columns 为 列名 => 值，varying 中的列为逐行的值列表（长度需等于 row_count），其余列所有行相同
+        """
+
+        varying = set(varying)
+        values: Dict[str, List[Any]] = {}
+        repeats: Dict[str, Optional[List[int]]] = {}
+        for name, value in columns.items():
+            if name in varying:
+                if len(value) != row_count:
+                    raise ValueError('列 {} 的行数 {} 与结果行数 {} 不一致'.format(name, len(value), row_count))
+                values[name], repeats[name] = list(value), None
+            else:
+                values[name], repeats[name] = [value], [row_count]
+        return cls(list(columns.keys()), values, repeats, row_count)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]]) -> "ColumnarResult":
+        """
+        由逐行的 dict 转换，列的顺序为各行键的首次出现顺序，连续相同的值合并
+        """
+
+        headers = list(dict.fromkeys(name for row in rows for name in row.keys()))
+        values: Dict[str, List[Any]] = {}
+        repeats: Dict[str, Optional[List[int]]] = {}
+        for name in headers:
+            column_values: List[Any] = []
+            column_repeats: List[int] = []
+            for row in rows:
+                value = row.get(name)
+                if column_repeats and column_values[-1] == value:
+                    column_repeats[-1] += 1
+                else:
+                    column_values.append(value)
+                    column_repeats.append(1)
+            values[name], repeats[name] = column_values, column_repeats
+        return cls(headers, values, repeats, len(rows))
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __repr__(self) -> str:
+        return '<ColumnarResult rows={} columns={}>'.format(self.row_count, self.headers)
+
+    def column(self, name: str) -> Iterator[Any]:
+        """
+        按行展开一列，不存在的列每行为 None
+        """
+
+        if name not in self.values:
+            return repeat(None, self.row_count)
+        column_repeats = self.repeats[name]
+        if column_repeats is None:
+            return iter(self.values[name])
+        return chain.from_iterable(repeat(value, count) for value, count in zip(self.values[name], column_repeats))
+
+    def iter_rows(self, headers: Optional[Sequence[str]] = None) -> Iterator[Tuple[Any, ...]]:
+        """
+        按 headers（默认本结果的列）的顺序逐行返回值元组
+        """
+
+        return zip(*[self.column(name) for name in (headers or self.headers)]) if self.row_count else iter(())
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.headers, row)) for row in self.iter_rows()]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'headers': self.headers, 'values': self.values, 'repeats': self.repeats, 'row_count': self.row_count}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ColumnarResult":
+        return cls(data['headers'], data['values'], data['repeats'], data['row_count'])
+
+
+def as_columnar(result: Any) -> Optional[ColumnarResult]:
+    """
+    统一解析结果：ColumnarResult 原样返回，List[Dict] 转换为 ColumnarResult，空结果返回 None
+    """
+
+    if result is None or isinstance(result, ColumnarResult):
+        return result
+    return ColumnarResult.from_rows(result)
@@ -0,0 +1,96 @@
+from pathlib import Path
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Type
+
+import yaml
+
+from .parser import ParserBase, PdfSource, ColumnarResult
+from .fields import FieldScanner
+from ptof.logger import logger
+
+
+class SpecParser(ParserBase):
+    """
+    由 YAML 声明的通用解析器：只按 fields 提取字段，列表字段（如 Wafer ID）展开为多行
+
+    YAML 示例::
+
+        name: SMIC
+        version: '1'
+        pages: [0, 1]
+        fields:
+          Date: {pattern: 'DATE\\s+(\\d{4}-\\d{2}-\\d{2})'}
+          Wafer_ID: {pattern: 'Wafer ID:\\s*((?:\\d+,)*\\d+)', split: ','}
+        columns:            # 输出列名及顺序，默认与 fields 相同
+          Date: 入库日期
+          Wafer_ID: Wafer ID
+    """
+
+    columns: Dict[str, str] = {}
+
+    def do(self, pdf_file: PdfSource, *args, **kwargs) -> Optional[ColumnarResult]:
+        import fitz
+        with self.open_pdf(pdf_file) as pdf:
+            flags = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_SPANS
+            page_text = self.extract_text(pdf, flags)
+        values = self.scan_fields(page_text)
+        logger.debug('提取到的字段: {}', values)
+
+        columns = self.columns or { name: name for name in values.keys() }
+        list_fields = [ name for name in columns.keys() if isinstance(values.get(name), list) ]
+        row_count = max([ len(values[name]) for name in list_fields ], default=1)
+        if not any(values.get(name) is not None for name in self.field_scanner().patterns):
+            return None
+        # 列表字段逐行取值（不足的行补空），其余字段所有行相同
+        parse_columns = {}
+        for name, column in columns.items():
+            value = values.get(name)
+            if name in list_fields:
+                value = value + [''] * (row_count - len(value))
+            parse_columns[column] = '' if value is None else value
+        return ColumnarResult.from_columns(parse_columns, row_count, varying=[columns[name] for name in list_fields])
+
+
+_loaded_specs: Set[str] = set()
+
+
+def load_parser_spec(spec_file: str | Path) -> Type[ParserBase]:
+    """
+    读取 YAML 解析器声明并注册到 ParserBase.plugins
+    """
+
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        spec_text = f.read()
+    spec: Dict[str, Any] = yaml.safe_load(spec_text)
+
+    scanner = FieldScanner(spec['fields'])
+    attrs: Dict[str, Any] = {
+        'name': spec['name'],
+        # 声明内容变化时解析缓存自动失效
+        'version': '{}-{}-{}'.format(spec.get('version', '1'), FieldScanner.version, hashlib.sha1(spec_text.encode('utf-8')).hexdigest()[:8]),
+        'fields': spec['fields'],
+        'columns': dict(spec.get('columns', {}) or {}),
+        '_field_scanner': scanner,
+        # 全部字段找到后不再读取后续页面
+        'required_patterns': dict(scanner.patterns),
+    }
+    if 'pages' in spec:
+        attrs['pages'] = list(spec['pages'])
+    if 'clip' in spec:
+        attrs['clip'] = tuple(spec['clip'])
+    parser_class = type(f'{spec["name"]}SpecParser', (SpecParser, ), attrs)
+    logger.debug('已加载解析器声明 {}: {}', spec['name'], spec_file)
+    return parser_class
+
+
+def load_parser_specs(config: dict) -> None:
+    """
+    加载 parse_results.parser_specs 中声明的解析器，每个进程每个文件只加载一次
+    """
+
+    for spec_file in config.get('parse_results', {}).get('parser_specs', []) or []:
+        spec_file = str(spec_file)
+        if spec_file in _loaded_specs:
+            continue
+        load_parser_spec(spec_file)
+        _loaded_specs.add(spec_file)
@@ -0,0 +1,146 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ptof.logger import logger
+
+
+# get_text('words') 返回 (x0, y0, x1, y1, word, block_no, line_no, word_no)
+Word = Tuple[float, float, float, float, str, int, int, int]
+
+
+class Line(object):
+    __slots__ = ('words', 'boxes', 'text', 'empty_before')
+
+    def __init__(self, words: List[str], boxes: np.ndarray, empty_before: int) -> None:
+        self.words = words
+        self.boxes = boxes
+        self.text = ' '.join(words)
+        self.empty_before = empty_before  # 与上一行之间的空行数
+
+
+def group_lines(page_words: Sequence[Sequence[Word]]) -> List[Line]:
+    """
+    按纵坐标把单词聚合成行（每行按横坐标排序），并估算行与行之间的空行数
+    跨页时，新页面的第一行视为紧接上一页
+    """
+
+    lines: List[Line] = []
+    for words in page_words:
+        if not words:
+            continue
+        boxes = np.array([word[:4] for word in words], dtype=float)
+        texts = np.array([word[4] for word in words], dtype=object)
+        heights = boxes[:, 3] - boxes[:, 1]
+        mids = (boxes[:, 1] + boxes[:, 3]) / 2
+        order = np.argsort(mids, kind='stable')
+        tolerance = max(float(np.median(heights)) * 0.5, 1.0)
+        groups = np.split(order, np.flatnonzero(np.diff(mids[order]) > tolerance) + 1)
+
+        line_mids = np.array([mids[group].mean() for group in groups])
+        gaps = np.diff(line_mids)
+        pitch = float(np.median(gaps)) if len(gaps) else 1.0
+        pitch = min(pitch, float(np.median(heights)) * 1.5) or 1.0
+        empty_before = np.concatenate(([0], np.maximum(np.rint(gaps / pitch) - 1, 0))).astype(int)
+
+        for group, empty in zip(groups, empty_before):
+            group = group[np.argsort(boxes[group, 0], kind='stable')]
+            lines.append(Line(list(texts[group]), boxes[group], int(empty)))
+    return lines
+
+
+def _char_width(lines: List[Line]) -> float:
+    widths = np.concatenate([line.boxes[:, 2] - line.boxes[:, 0] for line in lines])
+    lengths = np.array([len(word) for line in lines for word in line.words], dtype=float)
+    return float(np.median(widths / np.maximum(lengths, 1))) or 1.0
+
+
+def _cells(line: Line, columns: np.ndarray, column_count: int) -> List[str]:
+    cells = [[] for _ in range(column_count)]
+    for word, column in zip(line.words, columns):
+        cells[column].append(word)
+    return [' '.join(cell) for cell in cells]
+
+
+def word_table(page_words: Sequence[Sequence[Word]], table_sniff_str: str | re.Pattern) -> Dict[str, List]:
+    """
+    基于单词坐标提取表格：表头单词按间距分列，各列起始横坐标作为分箱边界，
+    用 NumPy 批量把表格内所有单词分配到列；续行规则与 format_table 相同
+    返回 {'headers': [...], 'rows': [[...], ...]}
+    """
+
+    table = {'headers': [], 'rows': []}
+    lines = group_lines(page_words)
+    if not lines:
+        return table
+
+    header_idx: Optional[int] = None
+    sniff_size = 0
+    for idx, line in enumerate(lines):
+        if isinstance(table_sniff_str, re.Pattern):
+            matched = table_sniff_str.match(line.text)
+            if matched:
+                header_idx, sniff_size = idx, len(matched[0])
+                break
+        elif line.text.startswith(table_sniff_str):
+            header_idx, sniff_size = idx, len(table_sniff_str)
+            break
+    if header_idx is None:
+        logger.warning("没有检测的表， 检测器：{}", table_sniff_str)
+        return table
+
+    # 表头分列：相邻单词间距超过两个字符宽度即为新列
+    char_width = _char_width(lines)
+    header = lines[header_idx]
+    gaps = header.boxes[1:, 0] - header.boxes[:-1, 2]
+    column_starts = header.boxes[np.concatenate(([0], np.flatnonzero(gaps > char_width * 2) + 1)), 0]
+    column_count = len(column_starts)
+
+    # 确定表格范围：连续空行超过一行或遇到分隔线时结束
+    end_idx = len(lines)
+    for idx in range(header_idx + 1, len(lines)):
+        if lines[idx].empty_before > 1 or lines[idx].text.startswith('_' * sniff_size):
+            end_idx = idx
+            break
+    table_lines = lines[header_idx:end_idx]
+
+    # 批量分列：单词起点落在哪个列起点之后即属于该列
+    x0 = np.concatenate([line.boxes[:, 0] for line in table_lines])
+    columns = np.clip(np.searchsorted(column_starts, x0 + char_width, side='right') - 1, 0, None)
+    splits = np.cumsum([len(line.words) for line in table_lines])[:-1]
+    line_columns = np.split(columns, splits)
+
+    header_keys = _cells(header, line_columns[0], column_count)
+    row_start = 1
+    for line, line_column in zip(table_lines[1:], line_columns[1:]):
+        if line_column[0] == 0:
+            break
+        row_start += 1
+        # 多行表头：上一段不以符号结尾时作为独立的表头
+        for idx, text in enumerate(_cells(line, line_column, column_count)):
+            if not text:
+                continue
+            if not re.search(r'\W$', header_keys[idx]):
+                header_keys[idx] += '\t' + text
+            else:
+                header_keys[idx] += text
+    for header_key in header_keys:
+        table['headers'].extend(header_key.split('\t'))
+
+    for line, line_column in zip(table_lines[row_start:], line_columns[row_start:]):
+        row_data = _cells(line, line_column, column_count)
+        while len(row_data) > 1 and row_data[-1] == '':
+            row_data.pop()
+        if row_data[0] == '' and table['rows']:
+            new_row_data = row_data[1:]
+            if new_row_data[0].find(':') != -1:
+                table['rows'].append(new_row_data)
+            else:
+                table['rows'][-1].extend(new_row_data)  # 如果是续行，则合并到上一行
+        else:
+            table['rows'].append(row_data)
+
+    logger.debug('格式化后的表头: {}', table['headers'])
+    logger.debug('格式化后的行: {}', table['rows'])
+    return table
@@ -0,0 +1,133 @@
+import signal
+import threading
+import ftplib
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from ptof.logger import logger
+from ptof.metrics import metrics
+from ptof import tools, imap
+
+
+class PipelineServer(object):
+    """
+    常驻运行的流水线：IMAP IDLE 监听新邮件（服务器不支持时自适应轮询），
+    解析进程池、配置和 FTP 连接在批次之间保持预热，断线后自动重连
+    """
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        serve_config = dict(config.get('serve', {}) or {})
+        self.idle_timeout = float(serve_config.get('idle_timeout', 600))  # RFC 2177 建议 29 分钟内重新 IDLE
+        self.poll_min = float(serve_config.get('poll_min', 30))
+        self.poll_max = float(serve_config.get('poll_max', 600))
+        self.reconnect_max = float(serve_config.get('reconnect_max', 300))
+        self.stop_event = threading.Event()
+        self.mail = None
+        self.ftp: Optional[ftplib.FTP] = None
+        self.executor = None
+        from ptof import sources
+        mailboxes = [ folder for source in sources.imap_sources(config) for folder in source['folders'] ]
+        self.single_mailbox = len(mailboxes) == 1
+
+    def stop(self, *_) -> None:
+        logger.info('收到退出信号，当前批次处理完成后退出')
+        self.stop_event.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        self.create_executor()
+        poll_interval = self.poll_min
+        reconnect_delay = 1.0
+        logger.info('常驻服务已启动')
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    if self.mail is None:
+                        self.mail = tools.connect_imap(self.config)
+                        logger.info('IMAP 已连接, 支持 IDLE: {}', imap.supports_idle(self.mail))
+                    handled = self.run_batch()
+                    reconnect_delay = 1.0
+                    if handled:
+                        poll_interval = self.poll_min
+                        continue  # 处理完立即再检查一次，避免漏掉处理期间到达的邮件
+                    if self.stop_event.is_set():
+                        break
+                    if imap.supports_idle(self.mail):
+                        imap.idle(self.mail, self.idle_timeout, self.stop_event)
+                    else:
+                        logger.debug('{} 秒后再次检查邮件', poll_interval)
+                        self.stop_event.wait(poll_interval)
+                        poll_interval = min(poll_interval * 2, self.poll_max)
+                except BrokenProcessPool as e:
+                    # 解析进程崩溃（如 PyMuPDF 段错误、被系统因内存不足结束）后进程池不能再使用，重新创建，连接保持不变
+                    logger.exception('解析进程池已损坏, {} 秒后重新创建: {}', reconnect_delay, e)
+                    self.shutdown_executor()
+                    self.stop_event.wait(reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, self.reconnect_max)
+                    self.create_executor()
+                except Exception as e:
+                    logger.exception('处理失败, {} 秒后重连: {}', reconnect_delay, e)
+                    self.close_connections()
+                    self.stop_event.wait(reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, self.reconnect_max)
+        finally:
+            self.close()
+        logger.info('常驻服务已退出')
+
+    def create_executor(self) -> None:
+        # 解析进程数为 1 时不创建进程池，在主进程中解析
+        self.executor = tools.create_parse_executor(self.config) if tools.get_parse_workers(self.config) > 1 else None
+
+    def shutdown_executor(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def run_batch(self) -> int:
+        """
+        处理一批新邮件，返回处理的附件数
+        """
+
+        try:
+            # 配置了多个来源或目录时，每批重新并发连接全部来源；IDLE 只监听第一个来源的第一个目录
+            mail = self.mail if self.single_mailbox else None
+            return tools.get_pipeline_runner(self.config)(self.config, mail, self.executor, self.get_ftp)
+        finally:
+            # 指标为进程启动以来的累计值，每批结束后刷新输出文件
+            metrics.write(self.config)
+
+    def get_ftp(self) -> ftplib.FTP:
+        """
+        复用 FTP 连接，失效时重新登录
+        """
+
+        if self.ftp is not None:
+            try:
+                self.ftp.voidcmd('NOOP')
+                return self.ftp
+            except ftplib.all_errors as e:
+                logger.info('FTP 连接已失效, 重新连接: {}', e)
+                self.ftp = None
+        self.ftp = tools.connect_ftp(self.config)
+        return self.ftp
+
+    def close_connections(self) -> None:
+        if self.mail is not None:
+            try:
+                self.mail.logout()
+            except Exception:
+                pass
+            self.mail = None
+        if self.ftp is not None:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+            self.ftp = None
+
+    def close(self) -> None:
+        self.close_connections()
+        self.shutdown_executor()
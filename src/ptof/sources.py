@@ -0,0 +1,387 @@
+import imaplib
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ptof import imap
+from ptof.logger import logger
+from ptof.mailbox_state import UidWatermark
+
+
+# 来源中可覆盖的连接参数，未填写时使用 imap 下的同名配置
+CONNECTION_KEYS = ['host', 'port', 'username', 'password', 'max_connections']
+# 来源中可覆盖的搜索参数
+SEARCH_KEYS = ['track_uids', 'subject_filter', 'since_days']
+
+# SINCE 日期格式固定使用英文月份，不受系统语言影响
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# 队列结束标记
+_DONE = object()
+
+
+def imap_sources(config: dict) -> List[Dict[str, Any]]:
+    """
+    邮件来源列表 imap.sources；未配置时由 imap 和 email_criteria 组成一个来源（收件箱）
+
+    每个来源::
+
+        name: supplier_a                  # 日志及附件去重使用，默认 username@host
+        host / port / username / password # 默认使用 imap 下的配置
+        folders: ['INBOX', 'Suppliers/A'] # 默认 ['INBOX']
+        senders: ['a@foo.bar']            # 发件人过滤，多个时为 OR，默认 email_criteria.sender
+        search: 'UNSEEN'                  # 搜索条件，默认 UNSEEN（track_uids 且已有 UID 记录时为 ALL）；显式配置 ALL 用于补录历史邮件（不标记已读）
+        max_connections: 2                # 同一服务器的最大并发连接数，默认 imap.max_connections
+        track_uids: true                  # 只搜索上次处理的最大 UID 之后的邮件，默认 imap.track_uids
+        subject_filter: true              # 只搜索主题包含 [解析器名] 的邮件，默认 imap.subject_filter
+        since_days: 30                    # 只搜索最近 N 天的邮件，默认 imap.since_days
+    """
+
+    imap_config = dict(config.get('imap', {}) or {})
+    default_sender = (config.get('email_criteria', {}) or {}).get('sender')
+    raw_sources = imap_config.get('sources') or [{}]
+
+    sources = []
+    for raw_source in raw_sources:
+        source = { key: imap_config.get(key) for key in CONNECTION_KEYS + SEARCH_KEYS }
+        source.update({ key: value for key, value in raw_source.items() if value is not None })
+        source['track_uids'] = bool(source.get('track_uids'))
+        source['subject_filter'] = bool(source.get('subject_filter'))
+        source['since_days'] = int(source.get('since_days') or 0)
+        source['port'] = int(source.get('port') or 993)
+        source['max_connections'] = max(1, int(source.get('max_connections') or 2))
+        source['folders'] = list(source.get('folders') or ['INBOX'])
+        senders = source.get('senders', [default_sender] if default_sender else [])
+        source['senders'] = [senders] if isinstance(senders, str) else list(senders)
+        # 记录 UID 时不再依赖已读标记；显式配置 ALL 表示补录历史邮件，不标记已读
+        source['mark_seen'] = str(source.get('search') or '').upper() != 'ALL'
+        # 还没有 UID 记录的目录（首次运行或刚升级）按未配置 track_uids 时的条件搜索，不重新处理已读邮件
+        source['first_search'] = str(source.get('search') or 'UNSEEN')
+        source['search'] = str(source.get('search') or ('ALL' if source['track_uids'] else 'UNSEEN'))
+        source.setdefault('name', '{}@{}'.format(source['username'], source['host']))
+        sources.append(source)
+    return sources
+
+
+def connect_source(source: Dict[str, Any], folder: str = 'INBOX') -> imaplib.IMAP4:
+    mail = imaplib.IMAP4_SSL(host=source['host'], port=source['port'])
+    mail.login(source['username'], source['password'])
+    status, data = mail.select(imap_quote(folder))
+    if status != 'OK':
+        mail.logout()
+        raise imaplib.IMAP4.error('选择邮箱目录 {} 失败: {}'.format(folder, data))
+    return mail
+
+
+def imap_quote(value: str) -> str:
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def imap_date(day: date) -> str:
+    return '{}-{}-{}'.format(day.day, MONTHS[day.month - 1], day.year)
+
+
+def or_criteria(key: str, values: List[str]) -> List[str]:
+    """
+    多个值组合为 OR KEY "a" (OR KEY "b" KEY "c")，没有值时返回空列表
+    """
+
+    if not values:
+        return []
+    criteria = '{} {}'.format(key, imap_quote(values[-1]))
+    for value in reversed(values[:-1]):
+        criteria = 'OR {} {} {}'.format(key, imap_quote(value), criteria if criteria.startswith(key) else f'({criteria})')
+    return [criteria]
+
+
+def parser_subjects(config: dict) -> List[str]:
+    """
+    已注册解析器对应的主题前缀 [解析器名]，包括内置、entry point 和 YAML 声明的解析器
+    """
+
+    from ptof import pdf_parser
+    pdf_parser.load_parser_specs(config)
+    return ['[{}]'.format(name) for name in pdf_parser.parser_names()]
+
+
+def search_criteria(source: Dict[str, Any], subjects: Iterable[str] = (), uid_from: int = 0) -> List[str]:
+    """
+    搜索条件：search [UID n:*] [SINCE 日期] [主题 OR 条件] [发件人 OR 条件]，由服务器过滤
+    """
+
+    criteria = [source['search']]
+    if uid_from:
+        criteria.append('UID {}:*'.format(uid_from))
+    if source.get('since_days'):
+        criteria.append('SINCE {}'.format(imap_date(date.today() - timedelta(days=source['since_days']))))
+    criteria += or_criteria('SUBJECT', list(subjects))
+    criteria += or_criteria('FROM', source['senders'])
+    return criteria
+
+
+def search_uids(mail: imaplib.IMAP4, source: Dict[str, Any], subjects: Iterable[str] = (), uid_from: int = 0) -> List[bytes]:
+    criteria = search_criteria(source, subjects, uid_from)
+    logger.debug('来源 {} 搜索条件: {}', source['name'], criteria)
+    status, messages = mail.uid('SEARCH', None, *criteria)
+    if status != 'OK':
+        logger.error('收取邮件失败: {}, 来源: {}', status, source['name'])
+        return []
+    # 按 UID 排序，拆分时每个连接处理一段连续的 UID
+    # UID n:* 在没有更大的 UID 时仍会返回最后一封邮件，需再过滤一次
+    return sorted([ uid for uid in messages[0].split() if int(uid) >= uid_from ], key=int)
+
+
+def uidvalidity(mail: imaplib.IMAP4, folder: str) -> Optional[str]:
+    """
+    当前选择目录的 UIDVALIDITY：优先使用 SELECT 的响应，否则发送 STATUS
+    """
+
+    _, data = mail.response('UIDVALIDITY')
+    if data and data[-1]:
+        value = data[-1]
+        return value.decode() if isinstance(value, bytes) else str(value)
+    status, data = mail.status(imap_quote(folder), '(UIDVALIDITY)')
+    if status == 'OK' and data and (matched := re.search(rb'UIDVALIDITY\s+(\d+)', data[0] if isinstance(data[0], bytes) else str(data[0]).encode())):
+        return matched.group(1).decode()
+    return None
+
+
+def folder_uids(config: dict, mail: imaplib.IMAP4, source: Dict[str, Any], folder: str) -> Tuple[List[bytes], Optional[tuple]]:
+    """
+    在已选择目录的连接上搜索待处理的邮件，返回 (UID 列表, 记录进度所需的 (MailboxState, 目录, UIDVALIDITY))
+    - subject_filter: 只搜索主题包含已注册解析器名称的邮件
+    - track_uids: 只搜索上次处理的最大 UID 之后的邮件，另加 ledger 中未完成的邮件；还没有记录时只搜索未读邮件
+    """
+
+    subjects = parser_subjects(config) if source['subject_filter'] else []
+    if not source['track_uids']:
+        return search_uids(mail, source, subjects), None
+
+    from ptof.mailbox_state import open_mailbox_state
+    from ptof.ledger import open_ledger
+
+    mailbox = '{}/{}'.format(source['name'], folder)
+    state = open_mailbox_state(config)
+    validity = uidvalidity(mail, folder)
+    if validity is None:
+        logger.warning('{} 没有返回 UIDVALIDITY，不记录处理进度', mailbox)
+    last_uid = state.last_uid(mailbox, validity)
+    if last_uid:
+        uids = search_uids(mail, source, subjects, last_uid + 1)
+    else:
+        uids = search_uids(mail, dict(source, search=source['first_search']), subjects)
+    ledger = open_ledger(config)
+    if ledger is not None and last_uid:
+        # 已记录进度但未处理完成的邮件（如中断时未保存的附件）
+        pending = [ uid.encode() for uid in ledger.pending_uids(mailbox) if int(uid) <= last_uid ]
+        uids = sorted(set(uids) | set(pending), key=int)
+    logger.debug('{} 上次处理到 UID {}, UIDVALIDITY {}', mailbox, last_uid, validity)
+    return uids, (state, mailbox, validity)
+
+
+def iter_mailbox_parts(config: dict, mail: imaplib.IMAP4, source: Dict[str, Any], folder: str, uids: List[bytes], watermark=None, range_idx: int = 0) -> Iterator[dict]:
+    """
+    在已选择目录的连接上按批获取 PDF 部分
+    - 未启用 ledger 时，本批被下游取走后标记已读
+    - 启用 ledger 时，已处理或已保存的附件不再下载；邮件的附件全部上传后由 flag_done_messages 标记已读
+    - 传入 watermark（mailbox_state.UidWatermark）时，本批被下游取走后记录处理进度
+    """
+
+    from ptof.ledger import open_ledger
+
+    batch_size = config['imap'].get('batch_size', 200)
+    mailbox = '{}/{}'.format(source['name'], folder)
+    search_all = not source['mark_seen']  # 补录历史邮件时不改变已读状态
+    ledger = open_ledger(config)
+    skip = None
+    if ledger is not None:
+        def skip(message: Dict[str, Any], part: Dict[str, Any]) -> bool:
+            return ledger.skip_part(mailbox, message['uid'], part['part'], message['header'].get('Message-ID'))
+
+    for uid_batch, parts in imap.iter_pdf_part_batches(mail, uids, config['attachments']['file_ext'], batch_size, skip):
+        for part in parts:
+            part['mailbox'] = mailbox
+        if ledger is not None:
+            for part in parts:
+                part['ledger_key'] = ledger.key(mailbox, part['uid'], part['part'])
+            ledger.record_many([(part['ledger_key'], 'fetched', {
+                'source': source['name'],
+                'folder': folder,
+                'mailbox': mailbox,
+                'uid': part['uid'],
+                'part': part['part'],
+                'message_id': part['header'].get('Message-ID'),
+                'flagged': 1 if search_all else 0,
+            }) for part in parts])
+        yield from parts
+        if watermark is not None:
+            watermark.done(range_idx, uid_batch)
+        if search_all:
+            continue
+        if ledger is None:
+            imap.mark_seen(mail, uid_batch, batch_size)
+        else:
+            # 没有待处理附件的邮件（无 PDF 或已处理完成）立即标记，其余等上传成功后再标记
+            pending_uids = { part['uid'] for part in parts }
+            done_uids = [ uid for uid in uid_batch if uid not in pending_uids and ledger.message_done(mailbox, uid) ]
+            imap.mark_seen(mail, done_uids, batch_size)
+            ledger.mark_flagged(mailbox, done_uids)
+
+
+def flag_done_messages(config: dict, mail: imaplib.IMAP4 | None = None) -> int:
+    """
+    将 ledger 中全部附件已上传（或跳过）的邮件标记为已读，返回标记的邮件数
+    传入 mail 时，第一个来源第一个目录的邮件使用该连接，其它目录按需新建连接
+    """
+
+    from ptof.ledger import open_ledger
+
+    ledger = open_ledger(config)
+    if ledger is None:
+        return 0
+    mailboxes: Dict[tuple, List[str]] = {}
+    for message in ledger.unflagged_messages():
+        mailboxes.setdefault((message['source'], message['folder'], message['mailbox']), []).append(message['uid'])
+    if not mailboxes:
+        return 0
+
+    batch_size = config['imap'].get('batch_size', 200)
+    source_list = imap_sources(config)
+    sources_by_name = { source['name']: source for source in source_list }
+    total = 0
+    for (source_name, folder, mailbox), uids in mailboxes.items():
+        source = sources_by_name.get(source_name)
+        if source is None:
+            logger.warning('来源 {} 已不在配置中，跳过标记已读: {}', source_name, mailbox)
+            continue
+        primary = mail is not None and source is source_list[0] and folder == source['folders'][0]
+        session = mail if primary else connect_source(source, folder)
+        try:
+            imap.mark_seen(session, uids, batch_size)
+        finally:
+            if not primary:
+                session.close()
+                session.logout()
+        ledger.mark_flagged(mailbox, uids)
+        total += len(uids)
+        logger.info('{} 中 {} 封邮件的附件已全部上传，标记为已读', mailbox, len(uids))
+    return total
+
+
+def split_uids(uids: List[bytes], parts: int) -> List[List[bytes]]:
+    """
+    按 UID 范围均分为 parts 段
+    """
+
+    size = -(-len(uids) // max(1, parts))
+    return [uids[idx:idx + size] for idx in range(0, len(uids), size)] if uids else []
+
+
+def iter_source_parts(config: dict, sources: Optional[List[Dict[str, Any]]] = None) -> Iterator[dict]:
+    """
+    并发获取全部来源、全部目录的 PDF 部分，合并为一个流
+    - 同一服务器（host:port）同时最多 max_connections 个连接
+    - 一个目录的邮件数超过 imap.split_threshold 时，按 UID 范围拆分到多个连接并发获取
+    """
+
+    sources = sources if sources is not None else imap_sources(config)
+    imap_config = config['imap']
+    split_threshold = int(imap_config.get('split_threshold', 1000))
+    out: queue.Queue = queue.Queue(maxsize=max(1, int(imap_config.get('batch_size', 200))))
+    stop = threading.Event()
+    semaphores: Dict[tuple, threading.Semaphore] = {}
+    for source in sources:
+        semaphores.setdefault((source['host'], source['port']), threading.Semaphore(source['max_connections']))
+    pending = {'jobs': 0}
+    lock = threading.Lock()
+
+    def put(item) -> bool:
+        # 消费端提前结束时，生产线程不再阻塞
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def submit(func, *args) -> None:
+        with lock:
+            pending['jobs'] += 1
+        executor.submit(run_job, func, *args)
+
+    def run_job(func, *args) -> None:
+        try:
+            func(*args)
+        except BaseException as e:
+            put(e)
+        finally:
+            with lock:
+                pending['jobs'] -= 1
+                finished = pending['jobs'] == 0
+            if finished:
+                put(_DONE)
+
+    def fetch_uids(source, folder, uids, mail=None, watermark=None, range_idx=0) -> None:
+        semaphore = semaphores[(source['host'], source['port'])]
+        if mail is None:
+            semaphore.acquire()
+        try:
+            if mail is None:
+                mail = connect_source(source, folder)
+            for part in iter_mailbox_parts(config, mail, source, folder, uids, watermark, range_idx):
+                if not put(part):
+                    return
+        finally:
+            try:
+                if mail is not None:
+                    mail.close()
+                    mail.logout()
+            finally:
+                semaphore.release()
+
+    def fetch_folder(source, folder) -> None:
+        semaphore = semaphores[(source['host'], source['port'])]
+        semaphore.acquire()
+        try:
+            mail = connect_source(source, folder)
+        except BaseException:
+            semaphore.release()
+            raise
+        try:
+            uids, progress = folder_uids(config, mail, source, folder)
+        except BaseException:
+            mail.logout()
+            semaphore.release()
+            raise
+        logger.info('来源 {} 目录 {} 符合条件的邮件数: {}', source['name'], folder, len(uids))
+        ranges = [uids]
+        if len(uids) > split_threshold:
+            ranges = split_uids(uids, source['max_connections'])
+            logger.info('来源 {} 目录 {} 按 UID 范围拆分为 {} 段并发获取', source['name'], folder, len(ranges))
+        watermark = UidWatermark(*progress, ranges) if progress is not None and uids else None
+        for range_idx, uid_range in enumerate(ranges[1:], start=1):
+            submit(fetch_uids, source, folder, uid_range, None, watermark, range_idx)
+        fetch_uids(source, folder, ranges[0] if ranges else [], mail, watermark, 0)
+
+    workers = sum(source['max_connections'] for source in sources) or 1
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ptof-imap')
+    try:
+        jobs = [(source, folder) for source in sources for folder in source['folders']]
+        if not jobs:
+            return
+        with lock:
+            pending['jobs'] += len(jobs)
+        for source, folder in jobs:
+            executor.submit(run_job, fetch_folder, source, folder)
+
+        while (item := out.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -1,138 +1,225 @@
 import os
 import yaml
-from email.parser import BytesParser
-from email.header import decode_header, Header
+from email.header import decode_header, make_header
 from email.utils import parseaddr
 import imaplib
 import ftplib
 from pathlib import Path
+import time
 from datetime import datetime
+from itertools import count, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 import re
+from contextlib import nullcontext
 
 from ptof.logger import logger, log_init
+from ptof.metrics import metrics
+
+if TYPE_CHECKING:
+    from ptof.pdf_parser import ColumnarResult
 
 
 
 def load_config(config_file) -> dict:
     # 加载配置文件
 
+    from ptof import bundle
+
     logger.info('从 {} 中加载配置', config_file)
     with open(config_file, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+        config = yaml.safe_load(f)
+    bundle.bundle_format(config or {})  # 打包格式有误或缺少依赖时在开始处理前报错，而不是解析完成后上传时
+    return config
 
 
-def fetch_emails(config) -> list:
+def connect_imap(config: dict) -> imaplib.IMAP4:
     """
-    从IMAP服务器中查找并获取邮件
+    连接并登录IMAP服务器，选择第一个来源的第一个目录（默认 INBOX），来源配置见 sources.imap_sources
     """
 
-    # 连接到IMAP服务器
-    mail = imaplib.IMAP4_SSL(host=config['imap']['host'])
-    mail.login(config['imap']['username'], config['imap']['password'])
-    
-    # 选择邮件箱（默认inbox）
-    mail.select('inbox')
-    email_type = 'UNSEEN'
-    # email_type = 'ALL'
-    # 搜索邮件# UNSEEN / ALL
-    status, messages = mail.search(None, email_type, 'FROM "{}"'.format(config['email_criteria']['sender']))
-    emails = []
-    if status == 'OK':
-        for num in messages[0].split():
-            status, data = mail.fetch(num, '(RFC822)')
-            if status == 'OK':
-                email_message = BytesParser().parsebytes(data[0][1])
-                emails.append(email_message)
-                if email_type != 'ALL':
-                    mail.store(num,'+FLAGS','\\Seen')
-            else:
-                logger.warning('查找邮件失败: {}', status)
-    else:
-        logger.error('收取邮件失败: {}', status)
-    
-    mail.close()
-    mail.logout()
-    return emails
+    from ptof import sources
+    source = sources.imap_sources(config)[0]
+    return sources.connect_source(source, source['folders'][0])
+
+
+def fetch_emails(config, mail: imaplib.IMAP4 | None = None) -> list:
+    """
+    从IMAP服务器中查找邮件，只下载 PDF 附件部分
+    返回 [{'uid', 'mailbox', 'header', 'part', 'filename', 'encoding', 'payload', ...}, ...]
+    传入 mail 时复用该连接，且不会关闭
+    """
+
+    return list(iter_emails(config, mail))
+
+
+def iter_emails(config, mail: imaplib.IMAP4 | None = None) -> Iterator[dict]:
+    """
+    流式获取邮件中的 PDF 附件部分，每次只从服务器取 imap.batch_size 封邮件
+    - 不传 mail 时，并发获取 imap.sources 中全部来源、全部目录，结果合并为一个流
+    - 传入 mail 时（常驻模式）复用该连接，只获取第一个来源当前选择的目录
+    """
+
+    from ptof import sources
+
+    if mail is None:
+        yield from sources.iter_source_parts(config)
+        return
+
+    # 搜索邮件 UNSEEN / ALL（可按主题、日期、UID 进度缩小范围）；BODYSTRUCTURE 与附件均为批量获取，BODY.PEEK 不会改变已读状态
+    source = sources.imap_sources(config)[0]
+    uids, progress = sources.folder_uids(config, mail, source, source['folders'][0])
+    logger.info('符合条件的邮件数: {}', len(uids))
+    watermark = sources.UidWatermark(*progress, [uids]) if progress is not None and uids else None
+    yield from sources.iter_mailbox_parts(config, mail, source, source['folders'][0], uids, watermark)
 
 def decode_str(s) -> str:
-    value, charset = decode_header(s)[0]
-    if charset:
-        value = value.decode(charset)
-    return value
+    # 主题可能只有部分编码，如 "[PackageList] =?utf-8?b?...?="，各段分别解码后拼接
+    return str(make_header(decode_header(s)))
 
 
-def download_attachments(config: dict, emails: list) -> list:
+def email_meta_info(email_msg) -> dict:
     """
-    下载PDF附件
+    提取邮件的发件人、收件人和主题
     """
 
+    email_meta = {}
+    for header in ['From', 'To', 'Subject']:
+        value = email_msg.get(header, '')
+        if value:
+            if header == 'Subject':
+                value = decode_str(value)  # 将主题名称解密
+                email_meta[header.lower()] = value
+            else:
+                hdr, addr = parseaddr(value)
+                email_meta[header.lower()] = addr
+    return email_meta
+
+
+def download_attachments(config: dict, parts: Iterable[dict]) -> list:
+    """
+    保存 fetch_emails 预先挑选出的PDF附件
+    """
+
+    return list(iter_attachments(config, parts))
+
+
+def iter_attachments(config: dict, parts: Iterable[dict]) -> Iterator[dict]:
+    """
+    逐个解码附件
+    - attachments.in_memory 为 true 时，解码后的内容放在 data 中直接交给解析器，不经过磁盘；
+      归档到 save_path（attachments.archive）由后台线程异步写入，生成器结束前等待写入完成；
+      等待写入的附件超过 attachments.archive_queue 个时暂停解码，归档磁盘较慢时内存占用仍有上限
+    - 否则保存到 save_path 后由解析器从磁盘读取，保存后即释放附件内容
+    dl_file 始终为归档文件路径，用于日志、输出文件命名和处理记录
+    """
+
+    from ptof import imap
+    from ptof.ledger import open_ledger
+
+    ledger = open_ledger(config)
     attachment_config = config['attachments']
+    in_memory = attachment_config.get('in_memory', True)
+    archive = attachment_config.get('archive', True) or not in_memory
     save_path = Path(attachment_config['save_path'])
     now_time = datetime.now().strftime('%Y%m%d%H%M%S')
-    if not save_path.exists():
+    if archive and not save_path.exists():
         save_path.mkdir(parents=True)
-    
-    attachment_file_save_paths = []
-    for email_msg in emails:
-        # 遍历所有附件
-        attachment_files = []
-        email_meta = {}
-        for header in ['From', 'To', 'Subject']:
-            value = email_msg.get(header, '')
-            if value:
-                if header == 'Subject':
-                    value = decode_str(value)  # 将主题名称解密
-                    email_meta[header.lower()] = value
-                else:
-                    hdr, addr = parseaddr(value)
-                    name = decode_str(hdr)
-                    value = u'%s <%s>' % (name, addr)
-                    email_meta[header.lower()] = addr
-
-        for part in email_msg.walk():
-            file_name = part.get_filename()  # 获取附件名称类型
-            contentType = part.get_content_type() #获取数据类型
-            mycode = part.get_content_charset()  #获取编码格式
-            
-            if file_name:
-                h = Header(file_name)
-                dh = decode_header(h)  # 对附件名称进行解码
-                filename = dh[0][0]
-                if dh[0][1]:
-                    filename = decode_str(str(filename, dh[0][1]))  # 将附件名称可读化
-                attachment_files.append(filename)
-                attachment_file_ext = filename.split('.')[-1]
-                config_file_ext = attachment_config['file_ext'].split('.')[-1]
-
-                if attachment_file_ext.lower() == config_file_ext.lower():
-                    data = part.get_payload(decode=True)  # 下载附件
-                    download_file = save_path.joinpath(now_time + '_' + filename)
-                    with open(download_file, 'wb') as f: # 在当前目录下创建文件，注意二进制文件需要用wb模式打开
-                        f.write(data)  # 保存附件
-                        attachment_info = email_meta.copy()
-                        attachment_info['dl_file'] = download_file
-                        attachment_info['attachment_file_name'] = filename
-                        attachment_file_save_paths.append(attachment_info)
-                    logger.info(f'附件 {filename} 已下载完成')
-                else:
-                    logger.warning(f'附件 {filename} 后缀 {attachment_file_ext} 和预期 {config_file_ext} 不匹配, 跳过')
-            elif contentType == 'text/plain': #or contentType == 'text/html':
-                # 输出正文 也可以写入文件
-                data = part.get_payload(decode=True)
-                content = data.decode(mycode)
-                # print('正文：',content)
-        logger.info('附件文件名列表: {}', attachment_files)
-    
-    return attachment_file_save_paths
-    
+
+    archive_executor = None
+    if in_memory and archive:
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ptof-archive')
+        archive_slots = threading.BoundedSemaphore(max(1, int(attachment_config.get('archive_queue', 8) or 8)))
+
+    def archive_in_background(download_file: Path, data: bytes, ledger_key: str | None) -> None:
+        try:
+            # 写入完成后才记录为已保存，中断时 ledger 中不会出现指向不完整文件的记录
+            if archive_attachment(download_file, data) and ledger is not None and ledger_key:
+                ledger.mark_saved(ledger_key, dl_file=download_file)
+        finally:
+            archive_slots.release()
+
+    email_metas = {}
+    archive_names = set()  # 本次已使用的归档文件名
+    try:
+        for part in parts:
+            message_key = (part.get('mailbox'), part['uid'])  # 不同邮箱目录的 UID 可能相同
+            if message_key not in email_metas:
+                email_metas[message_key] = email_meta_info(part['header'])
+            email_meta = email_metas[message_key]
+
+            filename = part['filename']  # 附件名称已在获取邮件结构时解码
+            if not filename:
+                filename = 'attachment_{}_{}{}'.format(part['uid'], part['part'], attachment_config['file_ext'])
+
+            # 同名附件加序号：归档文件不互相覆盖，解析时也不会因 dl_file 相同被当作同一个文件只解析一次
+            download_name = now_time + '_' + filename
+            if download_name in archive_names:
+                stem, ext = os.path.splitext(download_name)
+                download_name = next(name for name in ('{}_{}{}'.format(stem, n, ext) for n in count(2)) if name not in archive_names)
+            archive_names.add(download_name)
+            download_file = save_path.joinpath(download_name)
+            ledger_key = part.get('ledger_key') if ledger is not None else None
+            with metrics.timer('download_attachments') as record:
+                data = imap.decode_payload(part.pop('payload'), part['encoding'])  # 解码附件
+                record['bytes'] = len(data)
+            if ledger_key:
+                # 归档文件写入完成后才记录 dl_file 并标记为 saved（异步写入时由后台线程记录）；
+                # 未归档、尚未写入或写入失败的附件中断后重新下载，见 Ledger.skip_part
+                ledger.record(ledger_key, 'fetched', filename=filename, subject=email_meta.get('subject'),
+                              sender=email_meta.get('from'), recipient=email_meta.get('to'))
+            if archive_executor is not None:
+                archive_slots.acquire()  # 写入队列已满时等待
+                archive_executor.submit(archive_in_background, download_file, data, ledger_key)
+            elif archive and archive_attachment(download_file, data) and ledger_key:
+                ledger.mark_saved(ledger_key, dl_file=download_file)
+            logger.info(f'附件 {filename} 已下载完成, 来自邮件 {part["uid"]}')
+
+            attachment_info = email_meta.copy()
+            attachment_info['dl_file'] = download_file
+            attachment_info['attachment_file_name'] = filename
+            if in_memory:
+                attachment_info['data'] = data  # 解析后随附件信息一起释放
+            del data
+            if ledger_key:
+                attachment_info['ledger_key'] = ledger_key
+            yield attachment_info
+    finally:
+        if archive_executor is not None:
+            archive_executor.shutdown(wait=True)
 
 
-def extract_pdf_to_excel(config: dict, files: list) -> list:
+def archive_attachment(download_file: Path, data: bytes) -> bool:
+    """
+    将附件写入归档目录，先写入临时文件再改名，归档文件存在即为完整内容；失败时只记录错误，不影响解析
+    返回是否写入成功
+    """
+
+    temp_file = '{}.part'.format(download_file)
+    try:
+        with metrics.timer('archive_write') as record:
+            with open(temp_file, 'wb') as f: # 注意二进制文件需要用wb模式打开
+                f.write(data)
+            os.replace(temp_file, download_file)
+            record['bytes'] = len(data)
+        return True
+    except OSError as e:
+        logger.error('附件归档失败: {}, {}', download_file, e)
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        return False
+
+
+def extract_pdf_to_excel(config: dict, files: list, executor=None) -> list:
     """
     解析PDF内容并保存到Excel
+    传入 executor 时使用该进程池解析（常驻模式下进程池保持预热），否则按 workers 配置临时创建
     """
 
-    logger.debug('files: {}', files)
+    logger.debug('files: {}', [{ key: value for key, value in file.items() if key != 'data' } for file in files])
     handle_files = {}
     for file in files:
         if file['subject'] not in handle_files.keys():
@@ -140,59 +227,416 @@ def extract_pdf_to_excel(config: dict, files: list) -> list:
         else:
             handle_files[file['subject']].append(file)
 
-    logger.debug('dl_files: {}', files)
-
     parse_config = config['parse_results']
     if not files:
         return []
     
     # 请根据需要实现具体的PDF解析逻辑
-    import pandas as pd
-    from ptof import pdf_parser
+    from ptof import pdf_parser, writer
+
+    writer_name = parse_config.get('writer', 'openpyxl')
+    if writer_name not in writer.WriterBase.plugins:
+        logger.error('不支持的写入器: {}, 可选: {}', writer_name, list(writer.WriterBase.plugins.keys()))
+        return []
+    pdf_parser.load_parser_specs(config)  # YAML 声明的解析器
+    pdf_parser.pages.configure(config)  # 单进程解析时在主进程中生效
+    from ptof.ledger import open_ledger
+    ledger = open_ledger(config)
+    ledger_keys = {}  # PDF 文件 => 处理记录（同名文件可能对应多个附件）
+    for file in files:
+        if file.get('ledger_key'):
+            ledger_keys.setdefault(str(file['dl_file']), []).append(file['ledger_key'])
+    ledger_records = []
     
     output_files = []
     now_time = datetime.now().strftime('%Y%m%d%H%M')
     
+    # 先按主题确定解析器，生成待解析任务列表（保持输入顺序）
+    tasks = []
     parser_regex = re.compile('^\[\s*([^\[\]]+)\s*\]') # type: ignore
     for subject, subject_files in handle_files.items():
         search = parser_regex.search(subject)
         if not search:
             logger.warning("邮件主题 {} 中没有找到解析器名称", subject) 
+            ledger_records += [(key, 'skipped', {'error': '没有解析器名称'}) for file in subject_files for key in ledger_keys.get(str(file['dl_file']), [])]
             continue
         parser = pdf_parser.create_parser(search.group(1))
         if not parser:
             logger.warning("主题 {} 的 解析器名称 {} 不支持", subject, search.group(1))
+            ledger_records += [(key, 'skipped', {'error': '解析器不支持'}) for file in subject_files for key in ledger_keys.get(str(file['dl_file']), [])]
             continue
 
-        parse_files = list(set([ subject_file['dl_file'] for subject_file in subject_files ]))
+        parse_files = list(dict.fromkeys([ subject_file['dl_file'] for subject_file in subject_files ]))
         attachments = { str(subject_file['dl_file']) : subject_file for subject_file in subject_files }
-        
         for sub_file in parse_files:
-            
-            logger.info('开始解析 来自主题 {} 的文件 {}', subject, sub_file)
-            result = parser.do(sub_file)
-            if result is not None:
-                df = pd.DataFrame(result)
-                pdf_file = attachments[str(sub_file)]['attachment_file_name']
+            tasks.append((subject, parser.name, sub_file, attachments[str(sub_file)]))
+
+    workers = get_parse_workers(config, len(tasks))
+    logger.info('待解析文件数: {}, 解析进程数: {}', len(tasks), workers)
+    from ptof.cache import ParseCache
+    cache = ParseCache.from_config(config)
+    parser_names = [task[1] for task in tasks]
+    pdf_files = [task[2] for task in tasks]
+    caches = [cache] * len(tasks)
+    # 内存中的附件内容随任务传给解析进程，memoryview 不能序列化，转为 bytes
+    datas = [bytes(task[3]['data']) if isinstance(task[3].get('data'), memoryview) else task[3].get('data') for task in tasks]
+    from ptof import isolate
+    limits = isolate.parse_limits(config)
+    if limits['timeout'] or limits['memory_mb']:
+        # 每个文件在单独的子进程中解析，超时、超内存或异常时只影响该文件（不使用预热的进程池）
+        failures = isolate.run_isolated(_parse_task, list(zip(parser_names, pdf_files, caches, datas)), workers,
+                                        limits['timeout'], limits['memory_mb'], _isolated_worker_init, (config,))
+        outcomes = [value if reason is None else (None, {'seconds': seconds, 'failed': reason, 'error': value})
+                    for reason, value, seconds in failures]
+        for (subject, parser_name, sub_file, attachment), (result, stats), data in zip(tasks, outcomes, datas):
+            if not stats.get('failed'):
+                continue
+            logger.error('主题 {} 的文件 {} 解析失败（{}）: {}, 移入隔离目录', subject, sub_file, stats['failed'], stats['error'])
+            isolate.quarantine(limits['quarantine_path'], sub_file, data, {
+                'subject': subject, 'parser': parser_name, 'reason': stats['failed'], 'error': stats['error'],
+                'seconds': round(stats['seconds'], 3), 'timeout': limits['timeout'], 'memory_mb': limits['memory_mb'],
+            })
+    elif workers <= 1:
+        # 单进程（或只有一个文件）时在主进程中解析，不经过进程池
+        outcomes = [_parse_task(*args) for args in zip(parser_names, pdf_files, caches, datas)]
+    elif executor is not None:
+        # map 按提交顺序返回结果，保证输出顺序确定
+        outcomes = list(executor.map(_parse_task, parser_names, pdf_files, caches, datas))
+    else:
+        with create_parse_executor(config, workers) as executor:
+            outcomes = list(executor.map(_parse_task, parser_names, pdf_files, caches, datas))
+    del datas
+    if cache is not None:
+        cache.evict()
+
+    # 子进程中的耗时随结果带回主进程汇总
+    results = []
+    for (subject, parser_name, sub_file, attachment), (result, stats) in zip(tasks, outcomes):
+        if stats.get('failed'):
+            metrics.add('parse_failed', {'parser': parser_name, 'reason': stats['failed']}, seconds=stats['seconds'])
+            metrics.add_file(file=str(sub_file), parser=parser_name, rows=0, **stats)
+            results.append(None)
+            ledger_records += [(key, 'skipped', {'error': '已隔离: {}'.format(stats['failed'])}) for key in ledger_keys.get(str(sub_file), [])]
+            continue
+        rows = len(result) if result else 0
+        metrics.add('parse', {'parser': parser_name}, seconds=stats['seconds'], pages=stats.get('pages', 0), rows=rows)
+        metrics.add_file(file=str(sub_file), parser=parser_name, rows=rows, **stats)
+        results.append(result)
+        for key in ledger_keys.get(str(sub_file), []):
+            ledger_records.append((key, 'parsed', {}) if result is not None else (key, 'skipped', {'error': '解析结果为空'}))
+    if ledger is not None:
+        ledger.record_many(ledger_records)
+        ledger_records = []
+
+    # merge: '' 每个 PDF 一个文件, parser 同一解析器合并为一个文件, subject 同一主题合并为一个文件
+    merge = parse_config.get('merge') or ''
+    # 流式处理时每批调用一次，合并文件按批命名（秒、进程号、序号），同一分钟内的后一批不会覆盖前一批已上传的文件
+    merge_tag = '{}_{}_{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), os.getpid(), next(_merge_batches))
+    writers = {}
+    try:
+        for (subject, parser_name, sub_file, attachment), result, (_, stats) in zip(tasks, results, outcomes):
+            if stats.get('failed'):
+                continue  # 已隔离
+            if result is None:
+                logger.warning('主题 {} 的文件 {} 解析结果为空', subject, sub_file)
+                continue
+
+            if merge == 'parser':
+                writer_key = (parser_name, )
+                output_file = merge_tag + '_' + parser_name + '.xlsx'
+            elif merge == 'subject':
+                writer_key = (parser_name, subject)
+                output_file = merge_tag + '_' + re.sub(r'[\\/:*?"<>|\s]+', '_', subject) + '.xlsx'
+            else:
+                writer_key = (parser_name, str(sub_file))
+                pdf_file = attachment['attachment_file_name']
                 output_file = now_time + '_' + pdf_file.replace('.pdf', '.xlsx').replace('.PDF', '.xlsx')
-                output_file = os.path.join(parse_config['output'], parser.name, output_file)
-                output_dir = os.path.dirname(output_file)
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
+
+            if writer_key not in writers:
+                output_file = os.path.join(parse_config['output'], parser_name, output_file)
+                if output_file in output_files:
+                    # 同名附件各自输出，不覆盖前一个文件
+                    stem, ext = os.path.splitext(output_file)
+                    output_file = next(name for name in ('{}_{}{}'.format(stem, n, ext) for n in count(2)) if name not in output_files)
                 logger.debug('输出文件路径: {}', output_file)
-                df.to_excel(output_file, index=False)
+                writers[writer_key] = writer.create_writer(writer_name, output_file)
                 output_files.append(output_file)
-                logger.info('主题 {} 的文件 {} 解析结果已保存到 {}'.format(subject, sub_file, output_file))
-            else:
-                logger.warning('主题 {} 的文件 {} 解析结果为空', subject, sub_file)
-    
+            with metrics.timer('excel_write', {'writer': writer_name}) as record:
+                writers[writer_key].write_rows(result)
+                record['rows'] = len(result)
+            logger.info('主题 {} 的文件 {} 解析结果已写入 {}', subject, sub_file, writers[writer_key].output_file)
+            ledger_records += [(key, 'written', {'output_file': writers[writer_key].output_file}) for key in ledger_keys.get(str(sub_file), [])]
+            if not merge:
+                with metrics.timer('excel_write', {'writer': writer_name}) as record:
+                    record['count'] = 0
+                    close_writer(config, writers.pop(writer_key))
+    finally:
+        with metrics.timer('excel_write', {'writer': writer_name}) as record:
+            record['count'] = 0
+            for output_writer in writers.values():
+                close_writer(config, output_writer)
+    if ledger is not None:
+        ledger.record_many(ledger_records)  # Excel 文件全部关闭后再记录为已写入
     
     return output_files
 
 
-def upload_to_ftp(config: dict, files: list) -> None:
+_merge_batches = count(1)
+
+
+def close_writer(config: dict, output_writer) -> None:
     """
-    上传Excel文件到FTP服务器
+    关闭写入器；打包上传时记录写入的行数，用于 manifest
+    """
+
+    output_writer.close()
+    if config.get('upload_server', {}).get('bundle'):
+        from ptof import bundle
+        bundle.record_rows(output_writer.output_file, output_writer.row_count)
+
+
+def get_parse_workers(config: dict, task_count: int | None = None) -> int:
+    """
+    解析进程数: parse_results.workers, 未配置或为 0 时使用 CPU 核数, 传入 task_count 时不超过任务数
+    """
+
+    workers = int(config.get('parse_results', {}).get('workers') or os.cpu_count() or 1)
+    return max(1, min(workers, task_count) if task_count is not None else workers)
+
+
+def create_parse_executor(config: dict, workers: int | None = None):
+    """
+    创建解析进程池
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+    if workers is None:
+        workers = config.get('parse_results', {}).get('workers') or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=workers, initializer=_parse_worker_init, initargs=(config,))
+
+
+def parse_executor(config: dict):
+    """
+    流式处理和监听目录时预热的解析进程池（上下文管理器）；解析进程数为 1 时不创建，得到 None，在主进程中解析
+    """
+
+    return create_parse_executor(config) if get_parse_workers(config) > 1 else nullcontext()
+
+
+def _parse_worker_init(config: dict) -> None:
+    # fork 方式启动的子进程已继承日志配置，其它方式（如 Windows 的 spawn）需重新初始化
+    import multiprocessing
+    import signal
+    from ptof import pdf_parser
+    # Ctrl+C 由主进程处理并关闭进程池，子进程不打印 KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if multiprocessing.get_start_method() != 'fork':
+        log_init(config)
+    pdf_parser.load_parser_specs(config)
+    pdf_parser.pages.configure(config)
+
+
+def _isolated_worker_init(config: dict) -> None:
+    # 隔离的子进程可能在写日志时被强制结束，经 enqueue 队列写日志会留下未释放的队列锁，之后主进程写日志时一直阻塞；
+    # 子进程改为直接写入日志文件，日志轮转由主进程负责
+    _parse_worker_init(config)
+    log_config = { key: value for key, value in (config.get('log', {}) or {}).items() if key not in ('rotation', 'retention', 'compression') }
+    log_init(dict(config, log=log_config), enqueue=False)
+
+
+def _parse_task(parser_name: str, pdf_file: str | Path, cache=None, data: bytes | None = None) -> Tuple[Optional["ColumnarResult | List[Dict]"], dict]:
+    # 返回 (解析结果, 统计信息)，统计信息在子进程中产生，需随结果返回
+    stats = {}
+    start = time.perf_counter()
+    result = parse_pdf(parser_name, pdf_file, cache, stats, data)
+    stats['seconds'] = time.perf_counter() - start
+    return result, stats
+
+
+def parse_pdf(parser_name: str, pdf_file: str | Path, cache=None, stats: dict | None = None, data: bytes | memoryview | None = None) -> Optional["ColumnarResult | List[Dict]"]:
+    """
+    解析单个 PDF 文件，可在子进程中执行；解析器通过 pdf_parser.create_parser 获取
+    传入 data 时直接解析内存中的内容，pdf_file 只用于日志
+    传入 cache（ParseCache）时，相同内容的 PDF 直接返回缓存的解析结果
+    返回值统一为 ColumnarResult（逐行 dict 的结果和旧版本缓存中的结果均会转换），没有结果时为 None
+    传入 stats 时写入读取的页数、是否命中缓存等统计信息
+    """
+
+    if stats is None:
+        stats = {}
+    stats['cache_hit'] = False
+
+    from ptof import pdf_parser
+    parser = pdf_parser.create_parser(parser_name)
+    if not parser:
+        return None
+
+    cache_key = None
+    if cache is not None:
+        from ptof.cache import file_sha256, data_sha256
+        pdf_hash = data_sha256(data) if data is not None else file_sha256(pdf_file)
+        cache_key = cache.key(pdf_hash, parser.name, parser.version)
+        hit, result = cache.get(cache_key)
+        if hit:
+            logger.info('文件 {} 命中解析缓存, 解析器 {}', pdf_file, parser_name)
+            stats['cache_hit'] = True
+            return pdf_parser.as_columnar(result)  # 旧版本缓存中可能是逐行 dict
+
+    logger.info('开始解析 文件 {}, 解析器 {}', pdf_file, parser_name)
+    result = pdf_parser.as_columnar(parser.do(data if data is not None else pdf_file))  # 逐行 dict 的结果转为列式
+    stats.update(parser.stats)
+    if cache_key is not None:
+        cache.put(cache_key, result)
+    return result
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    将迭代器按固定大小分批，最后一批可能不足
+    """
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, max(1, int(size)))):
+        yield batch
+
+
+def iter_pipeline_attachments(config: dict, mail: imaplib.IMAP4 | None = None) -> Iterator[dict]:
+    """
+    流水线的附件来源：先继续处理 ledger 中上次未完成的附件，再获取新邮件
+    """
+
+    from ptof.ledger import open_ledger
+
+    ledger = open_ledger(config)
+    if ledger is not None:
+        resumed = ledger.resume_attachments()
+        if resumed:
+            logger.info('继续处理上次未完成的附件: {} 个', len(resumed))
+        yield from resumed
+    yield from iter_attachments(config, iter_emails(config, mail))
+
+
+def finish_pipeline(config: dict, mail: imaplib.IMAP4 | None = None) -> None:
+    """
+    流水线结束时将附件已全部上传的邮件标记为已读（启用 ledger 时）
+    """
+
+    from ptof import sources
+    try:
+        sources.flag_done_messages(config, mail)
+    except Exception as e:
+        # 未标记的邮件下次运行时会再次标记，不影响本次结果
+        logger.warning('标记已读失败: {}', e)
+
+
+def run_pipeline(config: dict, mail: imaplib.IMAP4 | None = None, executor=None, get_ftp: Callable[[], ftplib.FTP] | None = None,
+                 attachments: Iterable[dict] | None = None) -> int:
+    """
+    流式流水线：邮件按批获取，附件逐个解码保存，每凑满 parse_results.batch_size 个文件即解析、写入并上传
+    内存峰值只与批大小相关；返回处理的附件数
+    get_ftp 用于获取可复用的 FTP 连接，不传时按需新建并在结束时关闭
+    启用 ledger 时，先上传上次已写入未上传的文件，邮件在其附件全部上传后才标记已读
+    传入 attachments（如离线导入的附件）时处理这些附件，不连接 IMAP 服务器
+    """
+
+    from ptof.ledger import open_ledger
+
+    ledger = open_ledger(config)
+    batch_size = config['parse_results'].get('batch_size', 50)
+    ftp = None
+    total = 0
+
+    def upload(upload_files: list) -> None:
+        nonlocal ftp
+        if get_ftp is not None:
+            session = get_ftp()
+        else:
+            ftp = ftp or connect_ftp(config)
+            session = ftp
+        upload_to_ftp(config, upload_files, session)
+        if ledger is not None:
+            ledger.mark_uploaded(upload_files)
+
+    try:
+        if ledger is not None and (written_files := ledger.written_outputs()):
+            logger.info('上传上次未完成上传的文件: {} 个', len(written_files))
+            upload(written_files)
+        for files in batched(attachments if attachments is not None else iter_pipeline_attachments(config, mail), batch_size):
+            total += len(files)
+            upload_files = extract_pdf_to_excel(config, files, executor)
+            if not upload_files:
+                logger.warning("没有需要上传的文件")
+                continue
+            upload(upload_files)
+    finally:
+        if attachments is None:
+            finish_pipeline(config, mail)
+        if ftp is not None:
+            ftp.quit()
+    return total
+
+
+LOCAL_SUBJECT = re.compile(r'^\[([^\[\]]+)\]')
+
+
+def local_attachments(paths: Iterable[str | Path]) -> list:
+    """
+    本地文件按文件名开头的 [解析器名] 生成与 iter_attachments 相同格式的附件信息，没有匹配的跳过
+    """
+
+    files = []
+    for raw_file in paths:
+        raw_filename = os.path.basename(raw_file)
+        logger.debug('File Name {} From {}', raw_filename, raw_file)
+        search = LOCAL_SUBJECT.search(raw_filename)
+        if search:
+            logger.debug('Search Result {} From {}', search, raw_file)
+            files.append({
+                'subject': search[0] + 'From Local Path',
+                'dl_file': raw_file,
+                'from': 'local@local.com',
+                'to': 'local@local.com',
+                'attachment_file_name': raw_filename,
+            })
+        else:
+            logger.warning("文件 {} 没有匹配到主题，跳过", raw_file)
+    return files
+
+
+def process_local_files(config: dict, files: list, executor=None, index=None) -> list:
+    """
+    按 parse_results.batch_size 分批解析并上传本地文件 [(路径, 大小, 修改时间), ...]，返回上传的文件
+    传入 index（watch.FileIndex）时，每批上传成功后记入索引，未变化的文件下次不再处理
+    """
+
+    batch_size = config['parse_results'].get('batch_size', 50)
+    uploaded = []
+    for batch in batched(files, batch_size):
+        upload_files = extract_pdf_to_excel(config, local_attachments(path for path, _, _ in batch), executor)
+        if upload_files:
+            upload_to_ftp(config, upload_files)
+            uploaded.extend(upload_files)
+        if index is not None:
+            # 没有匹配主题或解析结果为空的文件同样记入，内容变化后才重新处理
+            index.mark(batch)
+    return uploaded
+
+
+def get_pipeline_runner(config: dict, mode: str | None = None) -> Callable[..., int]:
+    """
+    按 mode（默认 pipeline.mode）返回流水线函数: batch => run_pipeline, async => async_pipeline.run_pipeline
+    """
+
+    mode = mode or config.get('pipeline', {}).get('mode') or 'batch'
+    if mode == 'async':
+        from ptof import async_pipeline
+        return async_pipeline.run_pipeline
+    return run_pipeline
+
+
+def connect_ftp(config: dict) -> ftplib.FTP:
+    """
+    连接并登录FTP服务器
     """
 
     upload_config = config['upload_server']
@@ -202,11 +646,105 @@ def upload_to_ftp(config: dict, files: list) -> None:
               passwd=upload_config['password'])
     encoding = upload_config.get('encoding', 'utf-8')
     ftp.encoding = encoding # TODO: 需确认
-    for file in files:
-        logger.info('开始上传: {}', file)
-        with open(file, 'rb') as f:
-            file_name = os.path.basename(file)
-            ftp.storbinary(f'STOR {file_name}', f)
-        logger.info('上传: {} 完成', file)
-    
-    ftp.quit()
+    return ftp
+
+
+def upload_to_ftp(config: dict, files: list, ftp: ftplib.FTP | None = None) -> None:
+    """
+    上传Excel文件到FTP服务器
+    - 最多 upload_server.workers 个并发会话，块大小 upload_server.blocksize
+    - 上传前列出一次远程目录，大小一致的文件跳过
+    - 连接中断后重连，并通过 REST 断点续传
+    - 配置 upload_server.bundle 时，先将全部文件和 manifest 打包为一个文件，以临时文件名上传后 RNFR/RNTO 改名，
+      下游只会看到完整的打包文件
+    传入 ftp 时复用该连接，且不会关闭
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from ptof import ftp as ftp_tools, bundle
+
+    if not files:
+        return
+    upload_config = config['upload_server']
+    atomic = False
+    if fmt := bundle.bundle_format(config):
+        bundle_dir = os.path.join(config['parse_results']['output'], 'bundles')
+        files = [bundle.build_bundle(files, bundle_dir, fmt, upload_config.get('bundle_prefix') or 'ptof')]
+        atomic = True
+    workers = max(1, min(int(upload_config.get('workers', 1)), len(files)))
+    blocksize = int(upload_config.get('blocksize', 8192))
+    retries = int(upload_config.get('retries', 3))
+    retry_delay = float(upload_config.get('retry_delay', 1))
+    pool = ftp_tools.FTPPool(lambda: connect_ftp(config), workers, ftp)
+
+    remote_sizes = {}
+    if upload_config.get('skip_existing', True):
+        session = pool.acquire()
+        try:
+            remote_sizes = ftp_tools.list_remote_sizes(session, [os.path.basename(file) for file in files])
+        finally:
+            pool.release(session)
+
+    def upload(file: str) -> None:
+        file_name = os.path.basename(file)
+        local_size = os.path.getsize(file)
+        if remote_sizes.get(file_name) == local_size:
+            logger.info('远程已存在相同大小的文件, 跳过上传: {}', file)
+            metrics.add('ftp_skip', bytes=local_size)
+            return
+
+        with metrics.timer('ftp_upload') as record:
+            upload_with_retries(file, file_name, local_size)
+            record['bytes'] = local_size
+
+    def upload_with_retries(file: str, file_name: str, local_size: int) -> None:
+        offset = 0
+        remote_name = file_name + '.part' if atomic else file_name
+        for attempt in range(retries + 1):
+            session = None
+            try:
+                session = pool.acquire()  # 重连失败同样重试
+                if attempt > 0 and atomic and ftp_tools.remote_size(session, file_name) == local_size:
+                    # 上次改名已在服务器完成，只是没有收到 RNTO 的响应
+                    logger.info('远程已存在改名后的文件: {}', file_name)
+                else:
+                    if attempt > 0:
+                        # 断线重连后，从远程已有的字节处续传
+                        offset = ftp_tools.remote_size(session, remote_name) or 0
+                        if offset > local_size:
+                            offset = 0
+                    logger.info('开始上传: {}{}', file, ', 从 {} 字节续传'.format(offset) if offset else '')
+                    ftp_tools.upload_file(session, file, blocksize, offset, remote_name)
+                    if atomic:
+                        session.rename(remote_name, file_name)  # RNFR / RNTO
+            except ftplib.all_errors as e:
+                if session is not None:
+                    pool.discard(session)
+                if attempt >= retries:
+                    raise
+                delay = min(retry_delay * 2 ** attempt, 60)
+                logger.warning('上传 {} 失败, {:.1f} 秒后第 {} 次重试: {}', file, delay, attempt + 1, e)
+                time.sleep(delay)
+                continue
+            pool.release(session)
+            logger.info('上传: {} 完成', file)
+            return
+
+    try:
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # 等待全部完成后再抛出第一个失败
+                futures = [executor.submit(upload, file) for file in files]
+                errors = [future.exception() for future in futures if future.exception()]
+            if errors:
+                raise errors[0]
+        else:
+            for file in files:
+                upload(file)
+    finally:
+        pool.close()
+
+    if atomic:
+        # 打包文件已上传并改名，本地不再保留（上传失败时保留以便排查）
+        for file in files:
+            os.remove(file)
@@ -0,0 +1,242 @@
+import os
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ptof.logger import logger
+
+
+# (路径, 大小, 修改时间 ns)
+FileStat = Tuple[str, int, int]
+
+
+def scan_files(pdf_dir: str | Path, file_ext: str, recursive: bool = False) -> Iterator[FileStat]:
+    """
+    用 os.scandir 列出目录下的文件（扩展名不区分大小写），stat 信息直接来自目录项
+    """
+
+    file_ext = file_ext.lower()
+    pending = [str(pdf_dir)]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                pending.append(entry.path)
+                            continue
+                        if not entry.name.lower().endswith(file_ext) or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError as e:
+                        logger.warning('读取文件信息失败: {}, {}', entry.path, e)
+                        continue
+                    yield (entry.path, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning('读取目录失败: {}, {}', directory, e)
+
+
+def stat_files(paths: Iterable[str]) -> List[FileStat]:
+    files = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue  # 已被删除或移走
+        files.append((path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+class FileIndex(object):
+    """
+    已处理文件的索引（SQLite）：路径 + 大小 + 修改时间，未变化的文件不再处理
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, handled_at REAL NOT NULL)')
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["FileIndex"]:
+        index_file = (config.get('local', {}) or {}).get('index')
+        return cls(index_file) if index_file else None
+
+    def changed(self, files: Iterable[FileStat], chunk_size: int = 500) -> List[FileStat]:
+        """
+        过滤出新增或大小、修改时间有变化的文件
+        """
+
+        files = list(files)
+        known: Dict[str, Tuple[int, int]] = {}
+        with self.lock:
+            for idx in range(0, len(files), chunk_size):
+                paths = [file[0] for file in files[idx:idx + chunk_size]]
+                rows = self.db.execute('SELECT path, size, mtime_ns FROM files WHERE path IN ({})'.format(', '.join(['?'] * len(paths))), paths)
+                known.update({ path: (size, mtime_ns) for path, size, mtime_ns in rows })
+        return [file for file in files if known.get(file[0]) != (file[1], file[2])]
+
+    def mark(self, files: Iterable[FileStat]) -> None:
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT INTO files (path, size, mtime_ns, handled_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, handled_at = excluded.handled_at',
+                [(path, size, mtime_ns, now) for path, size, mtime_ns in files],
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+class DirectoryWatcher(object):
+    """
+    监听目录中写入完成（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）的文件
+    Linux 下使用 inotify，其它系统定时用 scan_files 比较大小和修改时间
+    """
+
+    # inotify 常量，见 <sys/inotify.h>
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, pdf_dir: str | Path, file_ext: str, recursive: bool = False, poll_interval: float = 5.0) -> None:
+        self.pdf_dir = str(pdf_dir)
+        self.file_ext = file_ext.lower()
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.fd: Optional[int] = None
+        self.watches: Dict[int, str] = {}
+        self.snapshot: Dict[str, Tuple[int, int]] = {}
+        self.reported: set = set()
+        if sys.platform.startswith('linux'):
+            try:
+                self._init_inotify()
+            except OSError as e:
+                logger.warning('inotify 不可用，改为每 {} 秒扫描一次: {}', poll_interval, e)
+                self.close()
+        if self.fd is None:
+            # 启动前已存在的文件由首次扫描处理，轮询只返回之后新增或修改的文件
+            self.snapshot = { path: (size, mtime_ns) for path, size, mtime_ns in scan_files(self.pdf_dir, self.file_ext, recursive) }
+            self.reported = set(self.snapshot)
+
+    def __enter__(self) -> "DirectoryWatcher":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _init_inotify(self) -> None:
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.fd = fd
+        self._add_watch(self.pdf_dir)
+        if self.recursive:
+            for root, dirs, _ in os.walk(self.pdf_dir):
+                for name in dirs:
+                    self._add_watch(os.path.join(root, name))
+
+    def _add_watch(self, directory: str) -> None:
+        import ctypes
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE_SELF
+        if self.recursive:
+            mask |= self.IN_CREATE
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, '{}: {}'.format(os.strerror(errno), directory))
+        self.watches[wd] = directory
+
+    def wait(self, timeout: float) -> List[str]:
+        """
+        等待最多 timeout 秒，返回写入完成的文件路径（可能为空）
+        """
+
+        if self.fd is None:
+            return self._poll(timeout)
+
+        paths: List[str] = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return paths
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            paths.extend(self._parse_events(data))
+        return list(dict.fromkeys(paths))
+
+    def _parse_events(self, data: bytes) -> List[str]:
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                # 事件队列溢出，重新扫描整个目录，由索引过滤已处理的文件
+                logger.warning('inotify 事件队列溢出，重新扫描目录 {}', self.pdf_dir)
+                paths.extend(path for path, _, _ in scan_files(self.pdf_dir, self.file_ext, self.recursive))
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # 新目录：先加监听，再扫描监听前已写入的文件
+                    try:
+                        self._add_watch(path)
+                        for root, dirs, _ in os.walk(path):
+                            for sub_dir in dirs:
+                                self._add_watch(os.path.join(root, sub_dir))
+                    except OSError as e:
+                        logger.warning('监听目录失败: {}', e)
+                    paths.extend(file_path for file_path, _, _ in scan_files(path, self.file_ext, True))
+                continue
+            if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO) and name.lower().endswith(self.file_ext):
+                paths.append(path)
+        return paths
+
+    def _poll(self, timeout: float) -> List[str]:
+        time.sleep(min(timeout, self.poll_interval))
+        snapshot = { path: (size, mtime_ns) for path, size, mtime_ns in scan_files(self.pdf_dir, self.file_ext, self.recursive) }
+        # 有变化的文件可能仍在写入，等到下一次扫描时大小和修改时间不再变化才返回
+        changed = { path for path, info in snapshot.items() if self.snapshot.get(path) != info }
+        stable = [ path for path in snapshot if path not in changed and path not in self.reported ]
+        self.reported = (self.reported - changed).intersection(snapshot)
+        self.reported.update(stable)
+        self.snapshot = snapshot
+        return stable
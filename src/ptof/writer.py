@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from ptof.logger import logger
+from ptof.pdf_parser.result import ColumnarResult, as_columnar
+
+
+class WriterBase(object):
+    """
+    解析结果写入器，按 name 注册，可追加多次写入同一个文件
+    """
+
+    name: str
+    plugins: Dict[str, Type["WriterBase"]] = {}
+
+    def __init__(self, output_file: str | Path, *args, **kwargs) -> None:
+        self.output_file = str(output_file)
+        self.headers: Optional[List[str]] = None
+        self.row_count = 0
+
+    def __init_subclass__(cls, *args, **kwargs) -> None:
+        super().__init_subclass__(*args, **kwargs)
+        if hasattr(cls, 'name') and cls.name:
+            cls.plugins[cls.name] = cls
+
+    def __enter__(self) -> "WriterBase":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write_rows(self, rows: ColumnarResult | List[Dict]) -> None:
+        """
+        追加写入一个解析结果，列式结果按列读取，不构造逐行的 dict
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class OpenpyxlWriter(WriterBase):
+    """
+    openpyxl 只写模式，逐行写入磁盘，内存占用与行数无关
+    """
+
+    name = 'openpyxl'
+
+    def __init__(self, output_file: str | Path, *args, **kwargs) -> None:
+        super().__init__(output_file, *args, **kwargs)
+        from openpyxl import Workbook
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+
+    def write_rows(self, rows: ColumnarResult | List[Dict]) -> None:
+        result = as_columnar(rows)
+        if not result:
+            return
+        if self.headers is None:
+            self.headers = list(result.headers)
+            self.sheet.append(self.headers)
+        for row in result.iter_rows(self.headers):
+            self.sheet.append(row)
+        self.row_count += len(result)
+
+    def close(self) -> None:
+        if self.workbook is not None:
+            self.workbook.save(self.output_file)
+            self.workbook = None
+
+
+class PandasWriter(WriterBase):
+    """
+    pandas.DataFrame.to_excel，与旧版本输出一致，解析结果缓存在内存中直到 close
+    """
+
+    name = 'pandas'
+
+    def __init__(self, output_file: str | Path, *args, **kwargs) -> None:
+        super().__init__(output_file, *args, **kwargs)
+        self.results: Optional[List[ColumnarResult]] = []
+
+    def write_rows(self, rows: ColumnarResult | List[Dict]) -> None:
+        result = as_columnar(rows)
+        if not result:
+            return
+        self.results.append(result)
+        self.row_count += len(result)
+
+    def close(self) -> None:
+        if self.results is not None:
+            import pandas as pd
+            # 每个结果按列构造 DataFrame，列不同的结果合并时取并集
+            frames = [pd.DataFrame({ name: list(result.column(name)) for name in result.headers }, columns=result.headers) for result in self.results]
+            (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()).to_excel(self.output_file, index=False)
+            self.results = None
+
+
+def create_writer(name: str, output_file: str | Path, *args, **kwargs) -> Optional[WriterBase]:
+    if name not in WriterBase.plugins.keys():
+        logger.error("Writer Not Found, name: {}, names: {}", name, WriterBase.plugins.keys())
+        return None
+
+    output_dir = os.path.dirname(str(output_file))
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    return WriterBase.plugins[name](output_file, *args, **kwargs)